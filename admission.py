@@ -0,0 +1,350 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from cancellation import stats
+from conversations import estimate_tokens
+from query_decomposition import decompose_query
+from search_planning import classify_query
+
+logger = logging.getLogger(__name__)
+
+# API keys and per-client quotas, e.g.
+#   {"key-abc": {"client": "frontend", "priority": "high", "tokens_per_day": 500000}}
+# With no file every caller is the unrestricted "anonymous" client.
+CLIENTS_FILE = os.getenv("CLIENTS_FILE", "clients.json")
+
+# Reject requests without an X-API-Key (otherwise they run as low-priority "anonymous")
+REQUIRE_API_KEY = os.getenv("REQUIRE_API_KEY", "").lower() in ("1", "true", "yes")
+
+# Quotas for clients that don't set their own (0 = unlimited)
+DEFAULT_QUOTAS = {
+    "requests_per_min": int(os.getenv("QUOTA_REQUESTS_PER_MIN", "60")),
+    "tokens_per_day": int(os.getenv("QUOTA_TOKENS_PER_DAY", "200000")),
+    "searches_per_day": int(os.getenv("QUOTA_SEARCHES_PER_DAY", "500")),
+}
+
+# Estimated tokens of all admitted, unfinished runs this worker will take on
+ADMISSION_TOKEN_CAPACITY = int(os.getenv("ADMISSION_TOKEN_CAPACITY", "60000"))
+
+# Share of that capacity each priority may fill, so low priority is shed first
+PRIORITY_CEILINGS = {"low": 0.6, "normal": 0.85, "high": 1.0}
+
+# Usage counters are added to the shared SQLite totals this often (seconds)
+USAGE_DB = os.getenv("USAGE_DB", "client_usage.sqlite")
+USAGE_FLUSH_INTERVAL_S = 30
+
+# How often each query type ends up needing a web search, before any runs are seen
+SEARCH_RATE_PRIORS = {"news": 0.9, "comparative": 0.9, "factual": 0.5}
+
+# Seconds a shed client is asked to wait before retrying
+SHED_RETRY_AFTER_S = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    client TEXT NOT NULL,
+    day TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    searches INTEGER NOT NULL DEFAULT 0,
+    shed INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (client, day)
+);
+"""
+
+COUNTERS = ("requests", "tokens", "searches", "shed", "rejected")
+
+
+class AdmissionError(Exception):
+    """A request was refused; carries the HTTP status and Retry-After to send"""
+
+    def __init__(self, status_code, detail, retry_after=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    def headers(self):
+        return {"Retry-After": str(int(self.retry_after))} if self.retry_after else None
+
+
+def today():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def seconds_until_midnight():
+    now = time.time()
+    return 86400 - now % 86400
+
+
+def key_name(api_key):
+    """Name for a client without one: a hash of its key, so the key itself never reaches logs"""
+    return "key-" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+def load_clients(path=CLIENTS_FILE):
+    """API key -> client settings (name, priority and quotas) from CLIENTS_FILE"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    clients = {}
+    for api_key, settings in raw.items():
+        client = {"client": settings.get("client") or key_name(api_key), "priority": settings.get("priority", "normal")}
+        for quota, default in DEFAULT_QUOTAS.items():
+            client[quota] = int(settings.get(quota, default))
+        clients[api_key] = client
+    return clients
+
+
+def anonymous_client(restricted):
+    """Callers without a key: unlimited when no clients are configured, else low priority"""
+    if not restricted:
+        return {"client": "anonymous", "priority": "normal",
+                "requests_per_min": 0, "tokens_per_day": 0, "searches_per_day": 0}
+    return {"client": "anonymous", "priority": "low", **DEFAULT_QUOTAS}
+
+
+class UsageStore:
+    """Daily per-client usage totals in SQLite, shared by all workers on a host"""
+
+    def __init__(self, path=USAGE_DB):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def add(self, day, deltas):
+        """Add {client: {counter: n}} to the day's totals and return all of that day's totals"""
+        with self._lock:
+            for client, counts in deltas.items():
+                self.conn.execute(
+                    f"""INSERT INTO usage (client, day, {", ".join(COUNTERS)})
+                        VALUES (?, ?, {", ".join("?" for _ in COUNTERS)})
+                        ON CONFLICT (client, day) DO UPDATE SET
+                        {", ".join(f"{c} = {c} + excluded.{c}" for c in COUNTERS)}""",
+                    (client, day, *(counts.get(c, 0) for c in COUNTERS)),
+                )
+            self.conn.commit()
+            rows = self.conn.execute("SELECT * FROM usage WHERE day = ?", (day,)).fetchall()
+        return {row["client"]: {c: row[c] for c in COUNTERS} for row in rows}
+
+
+class Ticket:
+    """An admitted request: who made it and what it was estimated to cost"""
+
+    def __init__(self, client, query_type, tokens, searches):
+        self.client = client
+        self.query_type = query_type
+        self.tokens = tokens
+        self.searches = searches
+        self.released = False
+
+
+class AdmissionController:
+    """
+    Per-client quotas and cost-aware load shedding.
+
+    Each request is identified by its API key, rate limited per client with
+    a token bucket, and given a cost estimate (tokens and Tavily calls) from
+    its likely route and prompt size. It is refused with 429 if that would
+    take the client over its daily token or search quota, and shed with 503
+    if the estimated tokens of everything in flight would pass its
+    priority's share of ADMISSION_TOKEN_CAPACITY.
+
+    Counters live in memory and are added to the SQLite totals every
+    USAGE_FLUSH_INTERVAL_S, so quotas hold across workers to within one
+    flush interval. Request rates are per worker.
+    """
+
+    def __init__(self, clients=None, store=None, capacity=ADMISSION_TOKEN_CAPACITY):
+        self.clients = load_clients() if clients is None else clients
+        self.store = store
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.buckets = {}
+        self.in_flight_tokens = 0
+        self.search_rate = dict(SEARCH_RATE_PRIORS)
+        self.day = today()
+        self.totals = {}
+        self.pending = {}
+        self.flush_task = None
+
+    # --- identity ---
+
+    def identify(self, api_key):
+        """Client settings for an API key, or AdmissionError(401)"""
+        if api_key:
+            # Compared in constant time, so response timing doesn't reveal how much of a key matched
+            offered = api_key.encode()
+            for key, client in self.clients.items():
+                if hmac.compare_digest(key.encode(), offered):
+                    return client
+            raise AdmissionError(401, "Unknown API key")
+        if REQUIRE_API_KEY:
+            raise AdmissionError(401, "Missing X-API-Key header")
+        return anonymous_client(restricted=bool(self.clients))
+
+    # --- usage ---
+
+    def _count(self, name, **counts):
+        with self._lock:
+            if today() != self.day:
+                self.day, self.totals, self.pending = today(), {}, {}
+            pending = self.pending.setdefault(name, {})
+            for counter, n in counts.items():
+                pending[counter] = pending.get(counter, 0) + n
+
+    def used(self, name, counter):
+        """Today's usage: shared totals from the last flush plus this worker's unflushed counts"""
+        with self._lock:
+            return self.totals.get(name, {}).get(counter, 0) + self.pending.get(name, {}).get(counter, 0)
+
+    # --- admission ---
+
+    def check_rate(self, client):
+        """Spend one request from the client's per-minute bucket, or AdmissionError(429)"""
+        limit = client["requests_per_min"]
+        if not limit:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self.buckets.get(client["client"], (float(limit), now))
+            tokens = min(limit, tokens + (now - updated) * limit / 60)
+            allowed = tokens >= 1
+            self.buckets[client["client"]] = (tokens - 1 if allowed else tokens, now)
+        if not allowed:
+            self._count(client["client"], rejected=1)
+            raise AdmissionError(429, "Request rate quota exceeded", retry_after=60 / limit)
+        self._count(client["client"], requests=1)
+
+    def estimate(self, query, conversation_context="", cached_sources=None):
+        """Expected (query type, tokens, Tavily calls) for a query, from its likely route"""
+        query_type = classify_query(query)
+        p_search = self.search_rate[query_type]
+        nodes = stats.node_tokens
+        prompt = estimate_tokens(query) + estimate_tokens(conversation_context)
+        # The query and conversation go into both the routing and the answering prompt
+        tokens = nodes["analyze"] + 2 * prompt
+        tokens += p_search * nodes["synthesize"] + (1 - p_search) * nodes["direct"]
+        searches = 0 if cached_sources else p_search * len(decompose_query(query))
+        return query_type, int(tokens), searches
+
+    def admit(self, client, query, conversation_context="", cached_sources=None):
+        """
+        Admit a request that will run the graph and return its Ticket.
+
+        Raises AdmissionError(429) when the estimate would exceed a daily
+        quota and AdmissionError(503) when shedding load.
+        """
+        name = client["client"]
+        query_type, tokens, searches = self.estimate(query, conversation_context, cached_sources)
+
+        for counter, quota, needed in (("tokens", "tokens_per_day", tokens),
+                                       ("searches", "searches_per_day", searches)):
+            limit = client[quota]
+            if limit and self.used(name, counter) + needed > limit:
+                self._count(name, rejected=1)
+                raise AdmissionError(429, f"Daily {counter} quota exceeded", retry_after=seconds_until_midnight())
+
+        ceiling = PRIORITY_CEILINGS.get(client["priority"], PRIORITY_CEILINGS["normal"])
+        with self._lock:
+            admitted = self.in_flight_tokens == 0 or (self.in_flight_tokens + tokens) <= ceiling * self.capacity
+            if admitted:
+                self.in_flight_tokens += tokens
+        if not admitted:
+            self._count(name, shed=1)
+            raise AdmissionError(503, "Server busy, try again shortly", retry_after=SHED_RETRY_AFTER_S)
+        return Ticket(name, query_type, tokens, searches)
+
+    def release(self, ticket, state=None):
+        """Finish an admitted request, charging what the run actually used (only the first call counts)"""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.in_flight_tokens -= ticket.tokens
+        if state is None:
+            return
+        self._count(ticket.client, tokens=state.get("tokens_used", 0), searches=state.get("search_calls", 0))
+        if state.get("needs_search") is None:
+            # Stopped before routing, so it says nothing about the search rate
+            return
+        with self._lock:
+            rate = self.search_rate[ticket.query_type]
+            self.search_rate[ticket.query_type] = 0.9 * rate + 0.1 * bool(state.get("needs_search"))
+
+    # --- persistence ---
+
+    async def flush(self):
+        """Add this worker's counts to the shared totals and pick up everyone else's"""
+        if self.store is None:
+            return
+        with self._lock:
+            day, pending, self.pending = self.day, self.pending, {}
+        try:
+            totals = await asyncio.to_thread(self.store.add, day, pending)
+        except Exception:
+            logger.exception("Could not persist client usage")
+            with self._lock:
+                for name, counts in pending.items():
+                    merged = self.pending.setdefault(name, {})
+                    for counter, n in counts.items():
+                        merged[counter] = merged.get(counter, 0) + n
+            return
+        with self._lock:
+            if day == self.day:
+                self.totals = totals
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(USAGE_FLUSH_INTERVAL_S)
+            await self.flush()
+
+    def start(self):
+        if self.store is None:
+            self.store = UsageStore()
+        self.flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await self.flush()
+
+    def report(self):
+        """Today's usage, quotas and remaining allowance per client"""
+        quotas = {client["client"]: client for client in self.clients.values()}
+        quotas.setdefault("anonymous", anonymous_client(restricted=bool(self.clients)))
+        with self._lock:
+            names = set(quotas) | set(self.totals) | set(self.pending)
+        clients = {}
+        for name in sorted(names):
+            usage = {counter: self.used(name, counter) for counter in COUNTERS}
+            client = quotas.get(name, {})
+            remaining = {
+                counter: max(0, client[quota] - usage[counter]) if client.get(quota) else None
+                for counter, quota in (("tokens", "tokens_per_day"), ("searches", "searches_per_day"))
+            }
+            clients[name] = {
+                "priority": client.get("priority"),
+                "usage": usage,
+                "quotas": {quota: client.get(quota) for quota in DEFAULT_QUOTAS},
+                "remaining": remaining,
+            }
+        return {
+            "day": self.day,
+            "in_flight_tokens": self.in_flight_tokens,
+            "capacity_tokens": self.capacity,
+            "search_rate": {k: round(v, 2) for k, v in self.search_rate.items()},
+            "clients": clients,
+        }
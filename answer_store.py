@@ -0,0 +1,94 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from fast_responses import canonical_dumps, compress
+
+# SQLite file holding published answers (shared by all workers on a host)
+ANSWER_DB = os.getenv("ANSWER_DB", "answers.sqlite")
+
+# Answers kept in memory together with their compressed forms
+MAX_CACHED_ANSWERS = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    body BLOB NOT NULL
+);
+"""
+
+
+def answer_id(body):
+    """Content address of a serialized answer"""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+class AnswerStore:
+    """
+    Content-addressed store of finished answers for GET /answers/{id}.
+
+    An answer's id is the hash of its canonical JSON, so the body behind an
+    id never changes and can be cached forever by browsers and CDNs. Hot
+    answers are kept in memory with each encoding compressed once, at a
+    higher level than per-request compression can afford.
+    """
+
+    def __init__(self, path=ANSWER_DB, max_cached=MAX_CACHED_ANSWERS):
+        self.max_cached = max_cached
+        self.cached = OrderedDict()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def _remember(self, key, body):
+        variants = {"identity": body}
+        with self._lock:
+            self.cached[key] = variants
+            while len(self.cached) > self.max_cached:
+                self.cached.popitem(last=False)
+        return variants
+
+    def put(self, result):
+        """Store a result dict and return its id (a no-op for answers already stored)"""
+        return self.put_body(canonical_dumps(result))
+
+    def put_body(self, body):
+        """Store an already serialized answer (e.g. fetched from a cluster peer) and return its id"""
+        key = answer_id(body)
+        with self._lock:
+            if key in self.cached:
+                self.cached.move_to_end(key)
+                return key
+            self.conn.execute(
+                "INSERT OR IGNORE INTO answers VALUES (?, ?, ?)", (key, time.time(), body)
+            )
+            self.conn.commit()
+        self._remember(key, body)
+        return key
+
+    def get(self, key, encoding=None):
+        """Answer body for an id in the given encoding ("br", "gzip" or None), or None"""
+        with self._lock:
+            variants = self.cached.get(key)
+            if variants is not None:
+                self.cached.move_to_end(key)
+        if variants is None:
+            with self._lock:
+                row = self.conn.execute("SELECT body FROM answers WHERE id = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            variants = self._remember(key, bytes(row[0]))
+
+        encoding = encoding or "identity"
+        # Concurrent requests may both compress; the results are identical
+        body = variants.get(encoding)
+        if body is None:
+            body = compress(variants["identity"], encoding, stored=True)
+            variants[encoding] = body
+        return body
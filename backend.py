@@ -1,22 +1,300 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
+import hmac
+import logging
 import os
+import re
 
-# Import our graph logic
-from graph_logic import create_graph
-
-# Load environment variables
+# Load environment variables before the project modules below read their settings
 load_dotenv()
 
+# Import our graph logic (cheap: LangGraph and the provider SDKs load lazily)
+from graph_logic import create_graph, new_research_state, get_llm, get_tavily_client, summarize_conversation
+from cancellation import (
+    RunCancelled, run_until_disconnect, run_graph, stats, drain, stream_graph, spent_state, END_OF_RUN
+)
+from checkpoints import CheckpointStore, resume_point, thread_config, request_hash
+from refresher import Refresher, ANSWER_CACHE_ENABLED, ANSWER_PREFETCH_ON_STARTUP, KNOWN_QUERIES, query_key
+from history_store import HistoryStore
+from conversations import ConversationStore
+from admission import AdmissionController, AdmissionError
+from answer_store import AnswerStore
+from fast_responses import CompressionMiddleware, json_response, dumps, choose_encoding, COMPRESS_MIN_BYTES
+from profiling import PROFILING_ENABLED, ProfilerBusy, profiler, memory
+from cluster import Cluster, ClusterMiddleware
+from query_log import QueryLog, QueryLogMiddleware, QUERY_LOG_INCLUDE_TEXT
+
+logger = logging.getLogger(__name__)
+
+# How often to delete expired checkpoints and idle conversations (seconds)
+CHECKPOINT_GC_INTERVAL = 3600
+
+# Compile graphs and build clients at startup instead of on the first request
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "").lower() in ("1", "true", "yes")
+
+# Key for the /admin endpoints; they are disabled while it is unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+
+# How long shutdown waits for open requests (enforced by the server, see
+# serve.py) and then for background graph runs to finish (seconds)
+DRAIN_TIMEOUT_S = float(os.getenv("DRAIN_TIMEOUT_S", "30"))
+
+# Graphs are compiled on first use (or by warmup()), so the server answers
+# /health without having imported LangGraph or the provider SDKs.
+# Plain graph for requests without an idempotency key
+graph = None
+graph_lock = asyncio.Lock()
+
+# Whether the Groq/Tavily clients the graph nodes use have been built
+clients_ready = False
+
+# Checkpointed graph and its store, opened when first needed
+checkpoint_store = CheckpointStore()
+checkpointed_graph = None
+checkpoint_lock = asyncio.Lock()
+gc_task = None
+
+# One lock per idempotency key so duplicate submissions run one at a time
+key_locks: dict[str, asyncio.Lock] = {}
+
+# Runs in progress per cacheable query, so concurrent duplicates share one run
+inflight_runs: dict[str, asyncio.Future] = {}
+
+# Structured per-request log, written by a background thread (QUERY_LOG_DIR)
+query_log = QueryLog()
+
+# Peers and query ownership when running as a cluster (CLUSTER_PEERS/CLUSTER_SELF)
+cluster = Cluster()
+
+# Per-client API keys, quotas and load shedding
+admission = AdmissionController()
+
+# Published answers for GET /answers/{id}, opened on first use
+answer_store = None
+
+# Multi-turn conversation turns and summaries, opened on first use
+conversation_store = None
+
+# Summaries being folded in the background, by conversation id
+fold_tasks: dict[str, asyncio.Task] = {}
+
+def compile_graph():
+    """Compile the plain graph (serve.py calls this before forking workers)"""
+    global graph
+    if graph is None:
+        graph = create_graph()
+    return graph
+
+def build_clients():
+    """Import the provider SDKs and build the shared clients"""
+    global clients_ready
+    get_llm()
+    get_tavily_client()
+    clients_ready = True
+
+async def ensure_clients():
+    # The SDK imports take seconds; in a thread they don't stall other connections
+    if not clients_ready:
+        async with graph_lock:
+            if not clients_ready:
+                await asyncio.to_thread(build_clients)
+
+async def get_graph():
+    """The plain graph, compiled in a worker thread on first use"""
+    await ensure_clients()
+    if graph is None:
+        async with graph_lock:
+            if graph is None:
+                await asyncio.to_thread(compile_graph)
+    return graph
+
+async def collect_checkpoints_periodically():
+    while True:
+        await checkpoint_store.collect_garbage()
+        # Forget locks for keys that are not currently running
+        for key in [k for k, lock in key_locks.items() if not lock.locked()]:
+            key_locks.pop(key, None)
+        await asyncio.sleep(CHECKPOINT_GC_INTERVAL)
+
+async def get_checkpointed_graph():
+    """Open the checkpoint store and compile the checkpointed graph on first use"""
+    global checkpointed_graph, gc_task
+    await ensure_clients()
+    async with checkpoint_lock:
+        if checkpointed_graph is None:
+            await checkpoint_store.open()
+            checkpointed_graph = await asyncio.to_thread(create_graph, checkpointer=checkpoint_store.saver)
+            gc_task = asyncio.create_task(collect_checkpoints_periodically())
+    return checkpointed_graph
+
+def get_answer_store():
+    global answer_store
+    if answer_store is None:
+        answer_store = AnswerStore()
+    return answer_store
+
+def get_conversation_store():
+    global conversation_store
+    if conversation_store is None:
+        conversation_store = ConversationStore()
+    return conversation_store
+
+async def collect_conversations_periodically():
+    while True:
+        await asyncio.sleep(CHECKPOINT_GC_INTERVAL)
+        if conversation_store is not None:
+            try:
+                await asyncio.to_thread(conversation_store.collect_garbage)
+            except Exception:
+                logger.exception("Could not delete expired conversations")
+
+async def conversation_state(client, query, conversation_id):
+    """Initial graph state for a query, carrying the conversation's context if it has one"""
+    if not conversation_id:
+        return new_research_state(query)
+    store = get_conversation_store()
+    stored_id = scoped_key(client, conversation_id)
+    standalone, cached_sources = await asyncio.to_thread(store.related, stored_id, query)
+    if standalone:
+        # A new topic doesn't need the earlier turns, and can use the answer cache
+        return new_research_state(query, conversation_id)
+    context, _ = await asyncio.to_thread(store.context, stored_id)
+    return new_research_state(query, conversation_id, context, cached_sources)
+
+async def record_turn(client, conversation_id, state):
+    """Store a finished turn and fold turns that no longer fit into the summary in the background"""
+    store = get_conversation_store()
+    # Stored per client, like idempotency keys, so one client can't read or extend another's conversation
+    conversation_id = scoped_key(client, conversation_id)
+    await asyncio.to_thread(
+        store.add_turn, conversation_id, state["query"], state["final_answer"], state.get("sources", [])
+    )
+    if conversation_id in fold_tasks:
+        return
+    _, overflow = await asyncio.to_thread(store.context, conversation_id)
+    if overflow:
+        task = asyncio.create_task(store.fold(conversation_id, overflow, summarize_conversation))
+        fold_tasks[conversation_id] = task
+        task.add_done_callback(lambda task: fold_finished(conversation_id, task))
+
+def fold_finished(conversation_id, task):
+    fold_tasks.pop(conversation_id, None)
+    if not task.cancelled() and task.exception() is not None:
+        # The turns stay unfolded and are retried after the next turn
+        logger.error("Summarizing conversation %s failed", conversation_id, exc_info=task.exception())
+
+def is_cacheable(state):
+    """Answers that depend on earlier conversation turns are not shared through the cache"""
+    return ANSWER_CACHE_ENABLED and not state["conversation_context"] and not state["cached_sources"]
+
+def result_fields(state):
+    """The parts of a final graph state that are returned to clients and cached"""
+    return {
+        "query": state["query"],
+        "final_answer": state["final_answer"],
+        "steps": state["steps"],
+        "needs_search": state["needs_search"]
+    }
+
+async def publish(fields):
+    """Store a result under its content address and return it with "answer_id" added"""
+    return {**fields, "answer_id": await asyncio.to_thread(get_answer_store().put, fields)}
+
+def step_events(steps, node=None):
+    """NDJSON step events for /ask/stream"""
+    return [dumps({"type": "step", "node": node, "step": step}) + b"\n" for step in steps]
+
+def result_event(result, **extra):
+    """The final NDJSON event of /ask/stream"""
+    return dumps({"type": "result", **result, **extra}) + b"\n"
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls `on_close` however it ends, even if the body was never started"""
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+def answer_response(result, headers=None, **extra):
+    """/ask response, serialized without the response_model round trip"""
+    return json_response(
+        {**result, **extra},
+        headers={"Content-Location": f"/answers/{result['answer_id']}", **(headers or {})}
+    )
+
+async def refresh_query(query):
+    """Recompute an answer in the background for the answer cache"""
+    return await publish(result_fields(await run_graph(await get_graph(), new_research_state(query))))
+
+# Stale-while-revalidate answer cache with background refreshing of hot queries
+refresher = Refresher(refresh_query)
+
+def warm_queries():
+    """Example-button queries plus the most asked queries from the shared history"""
+    queries = list(KNOWN_QUERIES)
+    try:
+        queries += HistoryStore().top_queries(limit=10)
+    except Exception:
+        pass
+    return list(dict.fromkeys(queries))
+
+async def warmup():
+    """Compile both graphs and build the provider clients ahead of the first request"""
+    await get_graph()
+    await get_checkpointed_graph()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Optionally warm up on startup; drain background runs and close the stores on shutdown"""
+    if WARMUP_ON_STARTUP:
+        await warmup()
+    if ANSWER_CACHE_ENABLED:
+        refresher.start(warm_queries() if ANSWER_PREFETCH_ON_STARTUP else ())
+    admission.start()
+    query_log.start()
+    conversation_gc_task = asyncio.create_task(collect_conversations_periodically())
+    yield
+    conversation_gc_task.cancel()
+    # By now the server has stopped accepting connections and waited for open
+    # requests; what is left are answer refreshes and conversation summaries
+    if not await drain(DRAIN_TIMEOUT_S, [*refresher.tasks, *fold_tasks.values()]):
+        logger.warning("Cancelling background runs still going after %ss", DRAIN_TIMEOUT_S)
+    await refresher.stop()
+    await admission.stop()
+    for task in list(fold_tasks.values()):
+        task.cancel()
+    if gc_task is not None:
+        gc_task.cancel()
+    await checkpoint_store.close()
+    await cluster.close()
+    query_log.stop()
+
 # Initialize FastAPI
 app = FastAPI(
     title="AI Research Assistant API",
     description="LangGraph-powered research assistant with web search",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# One log record per query request (innermost, so forwarded requests are logged by their owner)
+app.add_middleware(QueryLogMiddleware, query_log=query_log)
+
+# In cluster mode, send each query to the node that owns it (inside CORS)
+app.add_middleware(ClusterMiddleware, cluster=cluster)
+
 # Add CORS middleware (allows Streamlit to call this API)
 app.add_middleware(
     CORSMiddleware,
@@ -26,18 +304,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create graph instance
-graph = create_graph()
+# gzip/brotli for complete responses, negotiated from Accept-Encoding
+app.add_middleware(CompressionMiddleware)
 
 # Request/Response models
 class QueryRequest(BaseModel):
     query: str
+    conversation_id: Optional[str] = None  # continue a multi-turn conversation
 
 class QueryResponse(BaseModel):
     query: str
     final_answer: str
     steps: list[str]
     needs_search: bool
+    cache: str = "miss"  # "hit", "stale" (served while refreshing), "coalesced" (shared a concurrent run), "replayed" (finished Idempotency-Key run) or "miss"
+    freshness_age_s: float = 0.0  # how old the answer is
+    conversation_id: Optional[str] = None
+    answer_id: Optional[str] = None  # fetch again with GET /answers/{answer_id}
 
 # Routes
 @app.get("/")
@@ -48,7 +331,12 @@ def root():
         "message": "AI Research Assistant API is running!",
         "endpoints": {
             "/ask": "POST - Ask a question",
-            "/health": "GET - Check API health"
+            "/ask/stream": "POST - Ask a question, streaming steps as NDJSON",
+            "/answers/{answer_id}": "GET - A published answer (cacheable, supports ETag)",
+            "/health": "GET - Check API health",
+            "/stats": "GET - Run and cancellation counters",
+            "/cluster": "GET - Cluster membership and key ownership",
+            "/admin/usage": "GET - Per-client usage and quotas (X-Admin-Key)"
         }
     }
 
@@ -72,37 +360,458 @@ def health_check():
         "message": "All services configured"
     }
 
+@app.get("/stats")
+def run_stats():
+    """Graph run counters, tokens saved by cancelling, and answer cache state"""
+    return {**stats.snapshot(), "answer_cache": refresher.snapshot(), "query_log": query_log.snapshot()}
+
+# Cost fields for a request that spent nothing itself (a replay of a finished run)
+NO_COST = {"tokens_used": 0, "search_calls": 0}
+
+def query_log_fields(query, client, cache, state=None):
+    """
+    What the query log records about a request beyond status and latency;
+    `state` carries what this request itself spent
+    """
+    fields = {"query_hash": query_key(query)[:16], "client": client["client"], "cache": cache}
+    if QUERY_LOG_INCLUDE_TEXT:
+        fields["query"] = query
+    if state is not None:
+        needs_search = state.get("needs_search")
+        fields.update(
+            route=None if needs_search is None else "search" if needs_search else "direct",
+            node_ms=state.get("node_ms", {}),
+            tokens=state.get("tokens_used", 0),
+            search_calls=state.get("search_calls", 0),
+            results=len(state.get("sources") or [])
+        )
+    return fields
+
+def admission_error(error: AdmissionError):
+    return HTTPException(status_code=error.status_code, detail=error.detail, headers=error.headers())
+
+async def client_identity(x_api_key: Optional[str] = Header(default=None)):
+    """Resolve the caller from X-API-Key and spend one request from its rate quota"""
+    try:
+        client = admission.identify(x_api_key)
+        admission.check_rate(client)
+    except AdmissionError as e:
+        raise admission_error(e)
+    return client
+
+def scoped_key(client, key):
+    """
+    A client's Idempotency-Key or conversation id as stored, so one client
+    can't replay another's answer or read another's conversation
+    """
+    return f"{client['client']}:{key}"
+
+def admit(client, state):
+    """Admit a graph run for a client by its estimated cost, or refuse it (429) or shed it (503)"""
+    try:
+        return admission.admit(client, state["query"], state["conversation_context"], state["cached_sources"])
+    except AdmissionError as e:
+        raise admission_error(e)
+
+def require_admin(x_admin_key: Optional[str] = Header(default=None)):
+    """Guard for /admin endpoints: 404 unless ADMIN_API_KEY is set, 403 on a wrong key"""
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+
+@app.get("/admin/usage", dependencies=[Depends(require_admin)])
+def admin_usage():
+    """Today's usage, quotas and remaining allowance per client (needs X-Admin-Key)"""
+    return admission.report()
+
+async def claim_idempotency_key(key: str, initial_state: dict):
+    """Open the checkpointed graph and bind the key to this request (422 if it was used for another)"""
+    checkpointed = await get_checkpointed_graph()
+    fingerprint = request_hash(initial_state["query"], initial_state["conversation_id"])
+    if not await checkpoint_store.touch(key, fingerprint):
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return checkpointed
+
+async def run_idempotent(http_request: Request, key: str, initial_state: dict, progress=None):
+    """
+    Run (or resume, or replay) the checkpointed graph for an idempotency key;
+    returns (final state, whether it was replayed from a finished run)
+    """
+    checkpointed = await claim_idempotency_key(key, initial_state)
+    lock = key_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        status, stored = await resume_point(checkpointed, key)
+        if status == "done":
+            return stored, True
+        graph_input = None if status == "resume" else initial_state
+        result = await run_until_disconnect(
+            http_request, checkpointed, graph_input, thread_config(key), progress
+        )
+        return result, False
+
+# Yielded by stream_idempotent() instead of END_OF_RUN when a finished run is replayed
+REPLAYED = "__replayed__"
+
+async def stream_idempotent(checkpointed, key: str, initial_state: dict, progress=None):
+    """stream_graph() counterpart of run_idempotent(); a finished run yields only (REPLAYED, stored state)"""
+    lock = key_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        status, stored = await resume_point(checkpointed, key)
+        if status == "done":
+            yield REPLAYED, stored
+            return
+        graph_input = None if status == "resume" else initial_state
+        async for event in stream_graph(checkpointed, graph_input, thread_config(key), progress):
+            yield event
+
 @app.post("/ask", response_model=QueryResponse)
-def ask_question(request: QueryRequest):
+async def ask_question(
+    request: QueryRequest,
+    http_request: Request,
+    idempotency_key: Optional[str] = Header(default=None),
+    client: dict = Depends(client_identity)
+):
     """
     Process a research query using LangGraph
     
     - **query**: The question to research
+    - **conversation_id** (optional): continue a conversation; earlier turns are
+      passed to the model (older ones as a rolling summary) and a follow-up on
+      the same topic reuses the earlier search results
+    - **X-API-Key** (header): identifies the client whose quotas are charged
+    - **Idempotency-Key** (header, optional): retries with the same key resume
+      from the last completed node; repeats of a finished request return the
+      stored answer without calling Groq or Tavily again. Keys are scoped to
+      the client, and reusing one for a different query or conversation gets 422.
+    
+    If the client disconnects before the answer is ready, the graph run
+    (including any in-flight Groq/Tavily call) is cancelled. Requests over a
+    client's quota get 429, and requests shed under load get 503, both with
+    Retry-After.
     """
+    initial_state = await conversation_state(client, request.query, request.conversation_id)
+    http_request.state.query_log = query_log_fields(request.query, client, "miss")
+    
+    async def shared_answer(result, outcome, age=0.0):
+        http_request.state.query_log = query_log_fields(
+            request.query, client, outcome, {"needs_search": result["needs_search"]}
+        )
+        if request.conversation_id:
+            await record_turn(client, request.conversation_id, {**result, "sources": []})
+        return answer_response(
+            result, cache=outcome, freshness_age_s=round(age, 1),
+            conversation_id=request.conversation_id
+        )
+    
+    coalesce_key = None
+    if is_cacheable(initial_state):
+        cached = refresher.lookup(request.query)
+        if cached:
+            return await shared_answer(*cached)
+        if not idempotency_key:
+            coalesce_key = query_key(request.query)
+            if coalesce_key in inflight_runs:
+                # The same query is already running: wait for it instead of paying twice
+                fields = await asyncio.shield(inflight_runs[coalesce_key])
+                if fields is not None:
+                    return await shared_answer(fields, "coalesced")
+    
+    ticket = admit(client, initial_state)
+    leader = None
+    if coalesce_key and coalesce_key not in inflight_runs:
+        leader = inflight_runs[coalesce_key] = asyncio.get_running_loop().create_future()
+    result = None
+    replayed = False
+    progress = {}
     try:
         # Run the graph
-        result = graph.invoke({
-            "query": request.query,
-            "needs_search": False,
-            "search_results": "",
-            "final_answer": "",
-            "steps": []
-        })
+        if idempotency_key:
+            result, replayed = await run_idempotent(
+                http_request, scoped_key(client, idempotency_key), initial_state, progress
+            )
+        else:
+            result = await run_until_disconnect(http_request, await get_graph(), initial_state, progress=progress)
         
-        return QueryResponse(
-            query=request.query,
-            final_answer=result["final_answer"],
-            steps=result["steps"],
-            needs_search=result["needs_search"]
+        fields = await publish(result_fields(result))
+        http_request.state.query_log = query_log_fields(
+            request.query, client, "replayed" if replayed else "miss", {**result, **NO_COST} if replayed else result
+        )
+        if is_cacheable(initial_state):
+            refresher.store(request.query, fields)
+        if leader is not None:
+            leader.set_result(fields)
+        # A replayed request was already recorded as a turn the first time
+        if request.conversation_id and not replayed:
+            await record_turn(client, request.conversation_id, result)
+        return answer_response(
+            fields, headers={"Idempotent-Replayed": "true"} if replayed else None,
+            cache="replayed" if replayed else "miss", freshness_age_s=0.0, conversation_id=request.conversation_id
         )
     
+    except RunCancelled:
+        # Nobody is listening any more; 499 mirrors nginx's "client closed request"
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    
+    except HTTPException:
+        raise
+    
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error processing query: {str(e)}"
         )
+    
+    finally:
+        # Replays of a finished request cost nothing; a cancelled or failed run
+        # is charged (and logged) for what it had spent before it stopped
+        if result is None:
+            http_request.state.query_log = query_log_fields(request.query, client, "miss", spent_state(progress))
+        admission.release(ticket, None if replayed else result or spent_state(progress))
+        if leader is not None:
+            # Waiting duplicates run the query themselves if this run failed
+            if not leader.done():
+                leader.set_result(None)
+            inflight_runs.pop(coalesce_key, None)
+
+@app.post("/ask/stream")
+async def ask_question_stream(
+    request: QueryRequest,
+    http_request: Request,
+    idempotency_key: Optional[str] = Header(default=None),
+    client: dict = Depends(client_identity)
+):
+    """
+    Process a research query, streaming progress as newline-delimited JSON
+    
+    Emits {"type": "step", ...} as each node finishes, then one
+    {"type": "result", ...} with the QueryResponse fields, or
+    {"type": "error", "detail": ...}. Closing the connection cancels the run.
+    The answer cache, coalescing of identical queries, quotas, load shedding
+    and Idempotency-Key work as for /ask; a cached, coalesced or replayed
+    answer streams its stored steps and then the result, whose "cache" says
+    which it was.
+    """
+    initial_state = await conversation_state(client, request.query, request.conversation_id)
+    
+    cached = None
+    coalesce_key = None
+    if is_cacheable(initial_state):
+        cached = refresher.lookup(request.query)
+        if not cached and not idempotency_key:
+            coalesce_key = query_key(request.query)
+            if coalesce_key in inflight_runs:
+                # The same query is already running: wait for it instead of paying twice
+                fields = await asyncio.shield(inflight_runs[coalesce_key])
+                if fields is not None:
+                    cached = (fields, "coalesced", 0.0)
+    if cached:
+        result, outcome, age = cached
+        http_request.state.query_log = query_log_fields(
+            request.query, client, outcome, {"needs_search": result["needs_search"]}
+        )
+        
+        async def cached_events():
+            if request.conversation_id:
+                await record_turn(client, request.conversation_id, {**result, "sources": []})
+            for event in step_events(result["steps"]):
+                yield event
+            yield result_event(
+                result, cache=outcome, freshness_age_s=round(age, 1), conversation_id=request.conversation_id
+            )
+        
+        return StreamingResponse(cached_events(), media_type="application/x-ndjson")
+    
+    key = scoped_key(client, idempotency_key) if idempotency_key else None
+    checkpointed = await claim_idempotency_key(key, initial_state) if key else None
+    http_request.state.query_log = query_log_fields(request.query, client, "miss")
+    ticket = admit(client, initial_state)
+    leader = None
+    if coalesce_key and coalesce_key not in inflight_runs:
+        leader = inflight_runs[coalesce_key] = asyncio.get_running_loop().create_future()
+    
+    def finish(final_state=None):
+        admission.release(ticket, final_state)
+        if leader is not None:
+            # Waiting duplicates run the query themselves if this run failed
+            if not leader.done():
+                leader.set_result(None)
+            if inflight_runs.get(coalesce_key) is leader:
+                del inflight_runs[coalesce_key]
+    
+    async def events():
+        final_state = None
+        replayed = False
+        progress = {}
+        try:
+            if checkpointed is not None:
+                run = stream_idempotent(checkpointed, key, initial_state, progress)
+            else:
+                run = stream_graph(await get_graph(), initial_state, progress=progress)
+            async for node, update in run:
+                if node in (END_OF_RUN, REPLAYED):
+                    replayed = node == REPLAYED
+                    # Replays of a finished request cost nothing and were already recorded as a turn
+                    final_state = None if replayed else update
+                    outcome = "replayed" if replayed else "miss"
+                    http_request.state.query_log = query_log_fields(
+                        request.query, client, outcome, {**update, **NO_COST} if replayed else update
+                    )
+                    if request.conversation_id and not replayed:
+                        await record_turn(client, request.conversation_id, update)
+                    if replayed:
+                        for event in step_events(update.get("steps", [])):
+                            yield event
+                    result = await publish(result_fields(update))
+                    if is_cacheable(initial_state):
+                        refresher.store(request.query, result)
+                    if leader is not None:
+                        leader.set_result(result)
+                    yield result_event(
+                        result, cache=outcome, freshness_age_s=0.0, conversation_id=request.conversation_id
+                    )
+                else:
+                    for event in step_events((update or {}).get("steps", []), node):
+                        yield event
+        except Exception as e:
+            yield dumps({"type": "error", "detail": f"Error processing query: {str(e)}"}) + b"\n"
+        finally:
+            # A cancelled or failed run is charged (and logged) for what it had spent before it stopped
+            if final_state is None and not replayed:
+                final_state = spent_state(progress)
+                http_request.state.query_log = query_log_fields(request.query, client, "miss", final_state)
+            finish(final_state)
+    
+    # The generator's finally never runs if the client leaves before the body
+    # starts, so the response releases the ticket too (the first release wins)
+    return ReleasingStreamingResponse(events(), on_close=finish, media_type="application/x-ndjson")
+
+class ClusterMembers(BaseModel):
+    peers: list[str]
+
+@app.get("/cluster")
+def cluster_status():
+    """Cluster membership, unreachable peers and each node's share of the keys"""
+    return json_response(cluster.status())
+
+@app.post("/cluster/members", dependencies=[Depends(require_admin)])
+def update_cluster_members(members: ClusterMembers):
+    """
+    Replace the peer list (needs X-Admin-Key); send it to every node.
+    Consistent hashing moves only the keys of nodes that joined or left.
+    """
+    if cluster.self_url and cluster.self_url not in [peer.rstrip("/") for peer in members.peers]:
+        raise HTTPException(status_code=400, detail=f"peers must include this node ({cluster.self_url})")
+    cluster.set_peers(members.peers)
+    return json_response(cluster.status())
+
+ANSWER_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+@app.api_route("/answers/{answer_id}", methods=["GET", "HEAD"])
+async def get_answer(answer_id: str, request: Request):
+    """
+    A published answer by its content address (the answer_id from /ask)
+    
+    The body behind an id never changes, so it is sent with a far-future
+    immutable Cache-Control for HTTP caches and CDNs, and a request with a
+    matching If-None-Match gets 304 without reading the store. Stored
+    answers are compressed once per encoding and reused.
+    """
+    if not ANSWER_ID_PATTERN.fullmatch(answer_id):
+        raise HTTPException(status_code=404, detail="Answer not found")
+    
+    etag = f'W/"{answer_id}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding"
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in if_none_match or f'"{answer_id}"' in if_none_match:
+        return Response(status_code=304, headers=headers)
+    
+    store = get_answer_store()
+    body = await asyncio.to_thread(store.get, answer_id)
+    if body is None and cluster.enabled and not cluster.from_peer(request.headers):
+        # Published on the node that owned the query; fetch it once and keep a copy
+        fetched = await cluster.fetch_answer(answer_id)
+        if fetched is not None and await asyncio.to_thread(store.put_body, fetched) == answer_id:
+            body = fetched
+    if body is None:
+        raise HTTPException(status_code=404, detail="Answer not found")
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        body = await asyncio.to_thread(store.get, answer_id, encoding)
+        headers["Content-Encoding"] = encoding
+    if request.method == "HEAD":
+        return Response(status_code=200, headers={**headers, "Content-Length": str(len(body))},
+                        media_type="application/json")
+    return Response(body, headers=headers, media_type="application/json")
+
+# Debug endpoints for looking inside a live worker (PROFILING_ENABLED=1 and X-Admin-Key).
+# Each request is served by whichever worker accepts it; X-Worker-Pid says which.
+if PROFILING_ENABLED:
+    def worker_headers():
+        return {"X-Worker-Pid": str(os.getpid())}
+
+    @app.get("/debug/profile/cpu", dependencies=[Depends(require_admin)])
+    async def cpu_profile(seconds: float = 10.0, include_idle: bool = False):
+        """
+        Sample this worker's running stacks for `seconds` (max 60) and return
+        them in collapsed format, ready for flamegraph.pl or speedscope.
+        Threads blocked in a wait are skipped unless include_idle=true, which
+        gives a wall-clock profile instead.
+        """
+        if not seconds > 0:
+            raise HTTPException(status_code=400, detail="seconds must be positive")
+        try:
+            text, samples = await asyncio.to_thread(profiler.run, seconds, include_idle)
+        except ProfilerBusy as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return PlainTextResponse(text, headers={
+            **worker_headers(),
+            "X-Profile-Samples": str(samples),
+            "X-Profile-Clock": "wall" if include_idle else "cpu",
+            "Content-Disposition": f'attachment; filename="cpu-{os.getpid()}.collapsed"'
+        })
+
+    @app.get("/debug/memory", dependencies=[Depends(require_admin)])
+    def memory_status():
+        """Whether tracemalloc is tracing, traced bytes and the snapshots taken"""
+        return json_response(memory.status(), headers=worker_headers())
+
+    @app.post("/debug/memory/start", dependencies=[Depends(require_admin)])
+    def memory_start():
+        """Start tracing allocations (slows the worker down until /debug/memory/stop)"""
+        return json_response(memory.start(), headers=worker_headers())
+
+    @app.post("/debug/memory/stop", dependencies=[Depends(require_admin)])
+    def memory_stop():
+        """Stop tracing and drop all snapshots"""
+        return json_response(memory.stop(), headers=worker_headers())
+
+    @app.post("/debug/memory/snapshot", dependencies=[Depends(require_admin)])
+    async def memory_snapshot(limit: int = 20):
+        """Take a tracemalloc snapshot; returns its id and the largest allocation sites"""
+        try:
+            result = await asyncio.to_thread(memory.snapshot, stats.completed_runs, limit)
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return json_response(result, headers=worker_headers())
+
+    @app.get("/debug/memory/diff", dependencies=[Depends(require_admin)])
+    async def memory_diff(base: int, target: int, limit: int = 20, group_by: str = "lineno"):
+        """Allocation growth by site between two snapshots, with bytes per completed graph run"""
+        if group_by not in ("lineno", "filename", "traceback"):
+            raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+        try:
+            result = await asyncio.to_thread(memory.diff, base, target, limit, group_by)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return json_response(result, headers=worker_headers())
 
 # Run with: uvicorn backend:app --reload
+# In production use `python serve.py` (multiple workers, preload, warmup, draining)
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# How long a health result is trusted before it is refreshed in the background
+HEALTH_TTL_S = 10
+
+# Retries for /ask and /ask/stream (safe because every attempt carries the
+# same Idempotency-Key: the backend resumes or replays instead of rerunning)
+ASK_RETRIES = 3
+ASK_BACKOFF_S = 0.5
+
+# Sent as X-API-Key so the backend can apply this client's quotas
+BACKEND_API_KEY = os.getenv("BACKEND_API_KEY", "")
+
+
+class BackendError(Exception):
+    """The backend answered, but with an error"""
+
+
+class BackendClient:
+    """
+    HTTP client for the FastAPI backend, shared across Streamlit reruns.
+
+    Keeps one pooled keep-alive session so requests skip the TCP handshake,
+    serves the health status from a cache that is refreshed in a background
+    thread (so rendering never waits on it), and retries /ask with backoff
+    using an idempotency key so a retry never pays for the same work twice.
+    """
+
+    def __init__(self, base_url, health_ttl=HEALTH_TTL_S, timeout=30, api_key=BACKEND_API_KEY):
+        self.base_url = base_url.rstrip("/")
+        self.health_ttl = health_ttl
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers["X-API-Key"] = api_key
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            # Idempotent GETs (like /health) are retried by urllib3 itself
+            max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._health = "checking"
+        self._health_checked_at = 0.0
+        self._refreshing = False
+
+    # --- health ---
+
+    def health(self):
+        """
+        Last known backend status: "connected", "issue", "offline" or "checking".
+
+        Never blocks: a stale status triggers a background refresh and the
+        cached value is returned straight away.
+        """
+        with self._lock:
+            stale = time.monotonic() - self._health_checked_at > self.health_ttl
+            if stale and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_health, daemon=True).start()
+            return self._health
+
+    def _refresh_health(self):
+        try:
+            response = self.session.get(f"{self.base_url}/health", timeout=2)
+            status = "connected" if response.status_code == 200 else "issue"
+        except requests.exceptions.RequestException:
+            status = "offline"
+        with self._lock:
+            self._health = status
+            self._health_checked_at = time.monotonic()
+            self._refreshing = False
+
+    def _mark_offline(self):
+        with self._lock:
+            self._health = "offline"
+            self._health_checked_at = time.monotonic()
+
+    # --- asking ---
+
+    def _post_with_retry(self, path, query, conversation_id=None, **kwargs):
+        """POST with backoff on connection errors and 5xx, reusing one Idempotency-Key"""
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        for attempt in range(ASK_RETRIES + 1):
+            try:
+                response = self.session.post(
+                    f"{self.base_url}{path}",
+                    json={"query": query, "conversation_id": conversation_id},
+                    headers=headers,
+                    timeout=self.timeout,
+                    **kwargs,
+                )
+            except requests.exceptions.ConnectionError:
+                if attempt == ASK_RETRIES:
+                    self._mark_offline()
+                    raise
+            else:
+                if response.status_code < 500 or attempt == ASK_RETRIES:
+                    return response
+                response.close()
+            time.sleep(ASK_BACKOFF_S * 2 ** attempt)
+
+    def ask(self, query, conversation_id=None):
+        """Ask a question (optionally as a turn of a conversation) and return the full result"""
+        response = self._post_with_retry("/ask", query, conversation_id)
+        if response.status_code != 200:
+            raise BackendError(response.json().get("detail", "Unknown error"))
+        return response.json()
+
+    def ask_stream(self, query, conversation_id=None):
+        """
+        Ask a question and yield progress events as they arrive.
+
+        Yields dicts with "type" "step" (one per finished pipeline step) and
+        finally "result"; an "error" event is raised as BackendError.
+        """
+        response = self._post_with_retry("/ask/stream", query, conversation_id, stream=True)
+        with response:
+            if response.status_code != 200:
+                raise BackendError(response.json().get("detail", "Unknown error"))
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "error":
+                    raise BackendError(event["detail"])
+                yield event
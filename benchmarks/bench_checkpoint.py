@@ -0,0 +1,97 @@
+"""
+Measure the per-node cost of writing LangGraph checkpoints to SQLite.
+
+Runs the same three-node graph (no network, no LLM) with and without the
+checkpointer and reports the extra milliseconds each node costs.
+
+    python benchmarks/bench_checkpoint.py --runs 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.graph import StateGraph, END
+
+from checkpoints import CheckpointStore, thread_config
+from graph_logic import ResearchState
+
+NODES = ["analyze", "search", "synthesize"]
+
+# Roughly the size of real search results / answers so row sizes are realistic
+FAKE_RESULTS = "Source: https://example.com\n" + "lorem ipsum " * 400
+FAKE_ANSWER = "answer " * 300
+
+
+def build_graph(checkpointer=None):
+    async def analyze(state):
+        return {"needs_search": True, "tokens_used": 0, "steps": ["analyze"]}
+
+    async def search(state):
+        return {"search_results": FAKE_RESULTS, "tokens_used": 0, "steps": ["search"]}
+
+    async def synthesize(state):
+        return {"final_answer": FAKE_ANSWER, "tokens_used": 0, "steps": ["synthesize"]}
+
+    workflow = StateGraph(ResearchState)
+    workflow.add_node("analyze", analyze)
+    workflow.add_node("search", search)
+    workflow.add_node("synthesize", synthesize)
+    workflow.set_entry_point("analyze")
+    workflow.add_edge("analyze", "search")
+    workflow.add_edge("search", "synthesize")
+    workflow.add_edge("synthesize", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def initial_state():
+    return {
+        "query": "benchmark query",
+        "needs_search": False,
+        "search_results": "",
+        "final_answer": "",
+        "steps": [],
+        "tokens_used": 0,
+    }
+
+
+async def time_runs(graph, runs, checkpointed):
+    start = time.perf_counter()
+    for _ in range(runs):
+        config = thread_config(str(uuid.uuid4())) if checkpointed else None
+        await graph.ainvoke(initial_state(), config)
+    return time.perf_counter() - start
+
+
+async def main(runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = await CheckpointStore(path=os.path.join(tmp, "bench.sqlite")).open()
+        plain = build_graph()
+        checkpointed = build_graph(checkpointer=store.saver)
+
+        # Warm up both graphs so compilation/first-use costs are excluded
+        await time_runs(plain, 5, False)
+        await time_runs(checkpointed, 5, True)
+
+        plain_s = await time_runs(plain, runs, False)
+        checkpointed_s = await time_runs(checkpointed, runs, True)
+        await store.close()
+
+    per_run_ms = (checkpointed_s - plain_s) / runs * 1000
+    print(f"runs:                  {runs}")
+    print(f"without checkpointer:  {plain_s / runs * 1000:.3f} ms/run")
+    print(f"with checkpointer:     {checkpointed_s / runs * 1000:.3f} ms/run")
+    print(f"overhead per run:      {per_run_ms:.3f} ms")
+    print(f"overhead per node:     {per_run_ms / len(NODES):.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.runs))
@@ -0,0 +1,141 @@
+"""
+Answer-cache hit rate vs. node count, with and without cluster mode.
+
+Starts N local `uvicorn backend:app` processes with fake providers, sends a
+Zipf-distributed query mix to random nodes (as a load balancer would) and
+reports how often an answer came from a cache or a shared in-flight run.
+Without cluster mode each node warms its own cache, so the hit rate falls
+as nodes are added; with it, each query is answered by its owner node.
+Also prints how many keys move when a node joins, ring vs. modulo hashing.
+
+    python benchmarks/bench_cluster.py --nodes 1 2 4 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_startup import free_port
+from bench_throughput import wait_healthy
+from cluster import HashRing, ring_hash
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SHARED_OUTCOMES = ("hit", "stale", "coalesced")
+
+
+def key_movement(max_nodes, keys=20000):
+    print("nodes   moved (ring)   moved (modulo)")
+    names = [f"http://127.0.0.1:{9000 + i}" for i in range(max_nodes + 1)]
+    sample = [f"query-{i}" for i in range(keys)]
+    for n in range(1, max_nodes + 1):
+        before, after = HashRing(names[:n]), HashRing(names[:n + 1])
+        ring = sum(before.owner(k) != after.owner(k) for k in sample) / keys
+        modulo = sum(ring_hash(k) % n != ring_hash(k) % (n + 1) for k in sample) / keys
+        print(f"{n:>2}->{n + 1:<2}  {ring:>12.1%}   {modulo:>14.1%}")
+
+
+def start_nodes(count, clustered, workdir):
+    ports = [free_port() for _ in range(count)]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    processes = []
+    for i, port in enumerate(ports):
+        env = {
+            **os.environ,
+            "PROVIDER_MODE": "fake",
+            "ANSWER_CACHE_ENABLED": "1",
+            "CLIENTS_FILE": os.path.join(workdir, "no-clients.json"),
+            "CHECKPOINT_DB": os.path.join(workdir, f"checkpoints-{i}.sqlite"),
+            "HISTORY_DB": os.path.join(workdir, "history.sqlite"),
+            "CONVERSATION_DB": os.path.join(workdir, f"conversations-{i}.sqlite"),
+            "USAGE_DB": os.path.join(workdir, "usage.sqlite"),
+            "ANSWER_DB": os.path.join(workdir, f"answers-{i}.sqlite"),
+            "CLUSTER_MEMBERS_FILE": os.path.join(workdir, f"members-{i}.json"),
+            "CLUSTER_PEERS": ",".join(urls) if clustered else "",
+            "CLUSTER_SELF": urls[i] if clustered else "",
+            "CLUSTER_SECRET": "bench-cluster-secret",
+        }
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+    return ports, processes
+
+
+async def load(ports, queries, requests, concurrency, seed):
+    import httpx
+
+    rng = random.Random(seed)
+    # Zipf-like popularity: a few hot queries and a long tail
+    weights = [1 / (rank + 1) for rank in range(queries)]
+    mix = rng.choices(range(queries), weights=weights, k=requests)
+    targets = [rng.choice(ports) for _ in range(requests)]
+    outcomes, latencies = [], []
+    next_request = 0
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        async def user():
+            nonlocal next_request
+            while next_request < requests:
+                i = next_request
+                next_request += 1
+                start = time.perf_counter()
+                try:
+                    response = await client.post(
+                        f"http://127.0.0.1:{targets[i]}/ask", json={"query": f"benchmark question {mix[i]}"}
+                    )
+                    response.raise_for_status()
+                    outcomes.append(response.json()["cache"])
+                except Exception:
+                    outcomes.append("error")
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return outcomes, latencies, elapsed
+
+
+def bench(count, clustered, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        ports, processes = start_nodes(count, clustered, workdir)
+        try:
+            for port in ports:
+                wait_healthy(port)
+            outcomes, latencies, elapsed = asyncio.run(
+                load(ports, args.queries, args.requests, args.concurrency, args.seed)
+            )
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    shared = sum(outcome in SHARED_OUTCOMES for outcome in outcomes) / len(outcomes)
+    errors = outcomes.count("error")
+    latencies.sort()
+    print(f"{count:>5}  {'cluster' if clustered else 'single':<8}  {shared:>8.1%}  "
+          f"{len(outcomes) / elapsed:>7.1f}  {latencies[len(latencies) // 2] * 1000:>7.1f}  {errors:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queries", type=int, default=200, help="distinct queries in the mix")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    key_movement(max(args.nodes))
+    print("\nnodes  mode      hit rate    req/s   p50 ms  errors")
+    for count in args.nodes:
+        bench(count, False, args)
+        if count > 1:
+            bench(count, True, args)
@@ -0,0 +1,87 @@
+"""
+Serialization and transfer cost of /ask responses, typical vs. large answers.
+
+Compares the response_model path (Pydantic validation + jsonable_encoder +
+json.dumps, what FastAPI does by default) with stdlib json and orjson, then
+reports compressed size, compression time and estimated transfer time for
+each content coding at a given link speed.
+
+    python benchmarks/bench_serialization.py --mbps 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast_responses import brotli, compress, orjson
+
+PARAGRAPH = (
+    "Recent developments include larger context windows, cheaper inference and "
+    "open-weight models that match last year's frontier systems [1]. Researchers "
+    "also report progress on reasoning benchmarks and tool use [2]. "
+)
+
+
+def make_result(paragraphs, steps):
+    return {
+        "query": "What are the latest developments in AI?",
+        "final_answer": "\n\n".join(f"{i}. {PARAGRAPH}" for i in range(paragraphs)),
+        "steps": [f"✓ Step {i} finished" for i in range(steps)],
+        "needs_search": True,
+        "cache": "miss",
+        "freshness_age_s": 0.0,
+        "conversation_id": None,
+        "answer_id": "0" * 32,
+    }
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        out = fn()
+    return (time.perf_counter() - start) / runs * 1e6, out
+
+
+def serializers():
+    yield "json.dumps", lambda r: json.dumps(r, ensure_ascii=False, separators=(",", ":")).encode()
+    if orjson is not None:
+        yield "orjson", orjson.dumps
+    try:
+        from fastapi.encoders import jsonable_encoder
+        from backend import QueryResponse
+    except ImportError:
+        return
+    yield "response_model", lambda r: json.dumps(jsonable_encoder(QueryResponse(**r))).encode()
+
+
+def bench(name, result, runs, mbps):
+    print(f"\n{name}")
+    print("  serializer          us/op")
+    body = None
+    for label, fn in serializers():
+        us, out = timed(lambda: fn(result), runs)
+        body = body or out
+        print(f"  {label:<16} {us:>8.1f}")
+
+    encodings = [("identity", None), ("gzip-5", "gzip"), ("gzip-9 (stored)", "gzip")]
+    if brotli is not None:
+        encodings += [("br-5", "br"), ("br-9 (stored)", "br")]
+    print("  encoding            bytes   compress us   transfer ms")
+    for label, encoding in encodings:
+        stored = "stored" in label
+        us, out = timed(lambda: compress(body, encoding, stored=stored), max(1, runs // 10))
+        transfer_ms = len(out) * 8 / (mbps * 1e6) * 1000
+        print(f"  {label:<16} {len(out):>8}   {us:>11.1f}   {transfer_ms:>11.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--mbps", type=float, default=10.0, help="client link speed for transfer estimates")
+    args = parser.parse_args()
+
+    bench("typical answer (~2 KB, 6 steps)", make_result(8, 6), args.runs, args.mbps)
+    bench("large answer (~60 KB, 12 steps)", make_result(250, 12), args.runs, args.mbps)
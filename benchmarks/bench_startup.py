@@ -0,0 +1,81 @@
+"""
+Measure backend cold start: time to first healthy response and memory after boot.
+
+Starts `uvicorn backend:app` in a fresh process several times, polls
+/health until it answers 200, and reports the time from spawn to that
+first healthy response along with the server's resident memory (RSS).
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --warmup    # with WARMUP_ON_STARTUP=1
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid):
+    """Resident memory of a process in MB (Linux /proc)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+def measure_once(warmup, timeout):
+    port = free_port()
+    env = {**os.environ, "WARMUP_ON_STARTUP": "1" if warmup else "0"}
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start, rss_mb(server.pid)
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("server did not become healthy")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="set WARMUP_ON_STARTUP=1")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    times, memory = [], []
+    for _ in range(args.runs):
+        elapsed, rss = measure_once(args.warmup, args.timeout)
+        times.append(elapsed)
+        memory.append(rss)
+
+    print(f"runs:                       {args.runs}")
+    print(f"warmup on startup:          {args.warmup}")
+    print(f"time to first healthy (ms): median {statistics.median(times) * 1000:.0f}, "
+          f"min {min(times) * 1000:.0f}, max {max(times) * 1000:.0f}")
+    print(f"RSS after boot (MB):        median {statistics.median(memory):.1f}")
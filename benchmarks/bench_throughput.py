@@ -0,0 +1,93 @@
+"""
+Throughput of serve.py across worker counts, using local fake providers.
+
+For each worker count, starts `python serve.py` with PROVIDER_MODE=fake
+(no Groq/Tavily calls), keeps --concurrency requests in flight against
+/ask for --duration seconds, and reports requests/second and latency.
+
+    python benchmarks/bench_throughput.py --workers 1 2 4 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from bench_startup import free_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_healthy(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError("server did not become healthy")
+
+
+async def load(port, concurrency, duration):
+    import httpx
+
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        async def user(user_id):
+            nonlocal errors
+            n = 0
+            while time.monotonic() < deadline:
+                # Distinct queries so no caching layer can short-circuit the graph
+                query = f"benchmark question {user_id}-{n}"
+                n += 1
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/ask", json={"query": query})
+                    response.raise_for_status()
+                except Exception:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+    return latencies, errors
+
+
+def bench(workers, concurrency, duration):
+    port = free_port()
+    env = {**os.environ, "PROVIDER_MODE": "fake"}
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_healthy(port)
+        latencies, errors = asyncio.run(load(port, concurrency, duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    p99 = latencies[int(0.99 * (len(latencies) - 1))] if latencies else 0
+    print(f"{workers:>7}  {len(latencies) / duration:>9.1f}  "
+          f"{statistics.median(latencies) * 1000 if latencies else 0:>8.1f}  "
+          f"{p99 * 1000:>8.1f}  {errors:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0)
+    args = parser.parse_args()
+
+    print("workers      req/s   p50 ms   p99 ms  errors")
+    for workers in args.workers:
+        bench(workers, args.concurrency, args.duration)
@@ -0,0 +1,61 @@
+"""
+Report which imports dominate a module's import time.
+
+Runs `python -X importtime` in a fresh interpreter and lists the slowest
+top-level packages (cumulative) and the slowest individual modules (self).
+
+    python benchmarks/import_profile.py                # import backend
+    python benchmarks/import_profile.py --module graph_logic --top 15
+    python benchmarks/import_profile.py --code "import backend; backend.compile_graph()"
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_imports(code):
+    """List of (self_us, cumulative_us, depth, module) from -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-2000:])
+    return rows
+
+
+def report(rows, top):
+    total_us = sum(self_us for self_us, _, _, _ in rows)
+    print(f"modules imported: {len(rows)}")
+    print(f"total import time: {total_us / 1000:.1f} ms\n")
+
+    # Packages imported directly by the code under test (depth 0 in the tree)
+    print(f"Slowest top-level imports (cumulative, top {top})")
+    top_level = sorted((r for r in rows if r[2] == 0), key=lambda r: r[1], reverse=True)
+    for _, cumulative_us, _, name in top_level[:top]:
+        print(f"  {cumulative_us / 1000:9.1f} ms  {name}")
+
+    print(f"\nSlowest modules (self, top {top})")
+    for self_us, _, _, name in sorted(rows, key=lambda r: r[0], reverse=True)[:top]:
+        print(f"  {self_us / 1000:9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="backend", help="module to import")
+    parser.add_argument("--code", help="code to run instead of importing --module")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    report(profile_imports(args.code or f"import {args.module}"), args.top)
@@ -0,0 +1,121 @@
+"""
+Local HTTP server that stands in for the web pages Tavily points at.
+
+Serves generated article pages at /page/<n> with a configurable delay,
+ETag and Last-Modified headers, and answers conditional requests with
+304 so cache revalidation can be exercised without network access.
+/redirect/<n> redirects to /page/<n>, /redirect-to?url=<url> redirects
+anywhere, and /data serves JSON.
+
+    python benchmarks/stand_in_server.py --port 8765 --delay 0.2
+"""
+import argparse
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Fixed so Last-Modified never changes between runs
+LAST_MODIFIED = formatdate(1700000000, usegmt=True)
+
+PARAGRAPH = (
+    "This paragraph is part of the main article body and is long enough "
+    "to be kept by the boilerplate remover when the page is extracted."
+)
+
+
+def render_page(number, paragraphs=20):
+    body = "\n".join(f"<p>{PARAGRAPH} ({number}.{i})</p>" for i in range(paragraphs))
+    return f"""<html><head><title>Page {number}</title>
+<script>var tracking = true;</script></head>
+<body>
+<nav><a href="/">Home</a> | <a href="/about">About</a></nav>
+<article><h1>Article {number}</h1>
+{body}
+</article>
+<footer>Copyright stand-in server</footer>
+</body></html>"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    delay = 0.0
+    counts = {"200": 0, "304": 0}
+
+    def do_GET(self):
+        if self.path.startswith("/redirect/"):
+            self.redirect("/page/" + self.path.rsplit("/", 1)[-1])
+            return
+        if self.path.startswith("/redirect-to?"):
+            self.redirect(parse_qs(urlsplit(self.path).query)["url"][0])
+            return
+        if self.path == "/data":
+            body = b'{"text": "not a page"}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if not self.path.startswith("/page/"):
+            self.send_error(404)
+            return
+        time.sleep(self.delay)
+
+        html = render_page(self.path.rsplit("/", 1)[-1]).encode()
+        etag = '"' + hashlib.sha1(html).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            Handler.counts["304"] += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        Handler.counts["200"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(html)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(html)
+
+    def redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_pages(delay=0.0, port=0):
+    """Run the stand-in server in a background thread and yield its base URL"""
+    Handler.delay = delay
+    Handler.counts = {"200": 0, "304": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.2)
+    args = parser.parse_args()
+    with serve_pages(args.delay, args.port) as url:
+        print(f"Serving stand-in pages at {url}/page/<n> (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+
+# Rough token cost of each LLM node, used until real runs have been observed.
+# These are only priors for the "tokens saved" estimate, not billing numbers.
+DEFAULT_NODE_TOKENS = {
+    "analyze": 150,
+    "synthesize": 1500,
+    "direct": 600,
+}
+
+# Order in which nodes run on each path through the graph
+SEARCH_PATH = ["analyze", "plan", "decompose", "search", "synthesize"]
+DIRECT_PATH = ["analyze", "direct"]
+
+# How often (seconds) to check whether the client is still connected
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class RunCancelled(Exception):
+    """Raised when a graph run is aborted because the client went away"""
+
+
+class RunStats:
+    """Thread-safe counters for completed and cancelled graph runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed_runs = 0
+        self.cancelled_runs = 0
+        self.tokens_used = 0
+        self.tokens_saved = 0
+        # Exponential moving average of tokens per LLM node
+        self.node_tokens = dict(DEFAULT_NODE_TOKENS)
+
+    def record_node(self, node, tokens):
+        """Fold the observed token usage of one node into the average"""
+        if node not in self.node_tokens or not tokens:
+            return
+        with self._lock:
+            self.node_tokens[node] = 0.8 * self.node_tokens[node] + 0.2 * tokens
+
+    def run_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def run_finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_completed(self, tokens):
+        with self._lock:
+            self.completed_runs += 1
+            self.tokens_used += tokens
+
+    def record_cancelled(self, completed_nodes, needs_search, tokens):
+        """Count a cancelled run and estimate the tokens it did not spend"""
+        path = DIRECT_PATH if needs_search is False else SEARCH_PATH
+        remaining = [node for node in path if node not in completed_nodes]
+        saved = sum(self.node_tokens.get(node, 0) for node in remaining)
+        with self._lock:
+            self.cancelled_runs += 1
+            self.tokens_used += tokens
+            self.tokens_saved += int(saved)
+        return int(saved)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "completed_runs": self.completed_runs,
+                "cancelled_runs": self.cancelled_runs,
+                "tokens_used": self.tokens_used,
+                "tokens_saved_estimate": self.tokens_saved,
+            }
+
+
+stats = RunStats()
+
+
+# Marker yielded by stream_graph() together with the final state
+END_OF_RUN = "__end__"
+
+
+def new_progress(progress=None):
+    progress = progress if progress is not None else {}
+    progress.setdefault("completed", [])
+    progress.setdefault("tokens", 0)
+    progress.setdefault("search_calls", 0)
+    progress.setdefault("needs_search", None)
+    progress.setdefault("node_ms", {})
+    progress.setdefault("last_at", time.perf_counter())
+    return progress
+
+
+def track_node(progress, node, update):
+    """Record that a node finished, how long it took and what it cost"""
+    tokens = (update or {}).get("tokens_used", 0)
+    now = time.perf_counter()
+    # Nodes run one after another, so a node's time is the gap since the previous one
+    progress["node_ms"][node] = round((now - progress["last_at"]) * 1000, 1)
+    progress["last_at"] = now
+    progress["completed"].append(node)
+    progress["tokens"] += tokens
+    progress["search_calls"] += (update or {}).get("search_calls", 0)
+    if node == "analyze":
+        progress["needs_search"] = update.get("needs_search")
+    stats.record_node(node, tokens)
+
+
+def spent_state(progress):
+    """What a run that did not finish had already used, in the shape of a final state"""
+    return {
+        "tokens_used": progress.get("tokens", 0),
+        "search_calls": progress.get("search_calls", 0),
+        "needs_search": progress.get("needs_search"),
+        "node_ms": progress.get("node_ms", {}),
+    }
+
+
+async def run_graph(graph, initial_state, config=None, progress=None):
+    """
+    Run the graph to completion and return the final state, with the
+    milliseconds spent in each node added as "node_ms".
+
+    `progress` is an optional dict that is filled in as nodes finish, so a
+    caller that cancels the run can still see which nodes completed.
+    """
+    progress = new_progress(progress)
+
+    state = initial_state
+    stats.run_started()
+    try:
+        async for mode, chunk in graph.astream(
+            initial_state, config, stream_mode=["updates", "values"]
+        ):
+            if mode == "values":
+                state = chunk
+                continue
+            for node, update in chunk.items():
+                track_node(progress, node, update)
+    finally:
+        stats.run_finished()
+
+    stats.record_completed(progress["tokens"])
+    return {**state, "node_ms": progress["node_ms"]}
+
+
+async def stream_graph(graph, initial_state, config=None, progress=None):
+    """
+    Run the graph, yielding (node, update) as each node finishes and
+    finally (END_OF_RUN, final state with "node_ms" as in run_graph()).
+
+    For streaming responses: if the consumer goes away (the response is
+    cancelled on client disconnect) the in-flight node is cancelled with it
+    and the run is counted as cancelled. `progress` is filled in as for
+    run_graph().
+    """
+    progress = new_progress(progress)
+    state = initial_state
+    stats.run_started()
+    try:
+        async for mode, chunk in graph.astream(
+            initial_state, config, stream_mode=["updates", "values"]
+        ):
+            if mode == "values":
+                state = chunk
+                continue
+            for node, update in chunk.items():
+                track_node(progress, node, update)
+                yield node, update
+    except (asyncio.CancelledError, GeneratorExit):
+        stats.record_cancelled(
+            progress["completed"], progress["needs_search"], progress["tokens"]
+        )
+        raise
+    finally:
+        stats.run_finished()
+
+    stats.record_completed(progress["tokens"])
+    yield END_OF_RUN, {**state, "node_ms": progress["node_ms"]}
+
+
+async def drain(timeout, tasks=()):
+    """
+    Wait up to `timeout` seconds for in-flight graph runs and the given
+    background tasks to finish; True if all did
+    """
+    deadline = time.monotonic() + timeout
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+    while stats.in_flight > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    return stats.in_flight == 0 and all(task.done() for task in tasks)
+
+
+async def run_until_disconnect(request, graph, initial_state, config=None, progress=None):
+    """
+    Run the graph, cancelling it cooperatively if the HTTP client disconnects.
+
+    Cancelling the task propagates asyncio.CancelledError into whatever
+    provider call is in flight, so the underlying HTTP request is aborted
+    instead of running to completion for nobody. `progress` is filled in as
+    for run_graph(), so a caller can charge what a cancelled or failed run
+    already spent.
+    """
+    progress = {} if progress is None else progress
+    task = asyncio.create_task(run_graph(graph, initial_state, config, progress))
+
+    while not task.done():
+        try:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        except asyncio.CancelledError:
+            # The request handler itself was cancelled (e.g. server shutdown)
+            task.cancel()
+            raise
+        if done:
+            break
+        if await request.is_disconnected():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            stats.record_cancelled(
+                progress.get("completed", []),
+                progress.get("needs_search"),
+                progress.get("tokens", 0),
+            )
+            raise RunCancelled("Client disconnected")
+
+    return task.result()
@@ -0,0 +1,212 @@
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+# off | record | replay
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+
+# Gzipped JSONL file holding one recorded provider call per line
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassettes/providers.jsonl.gz")
+
+# Replayed calls sleep for their recorded duration times this (0 = no delay)
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0"))
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a call was never recorded"""
+
+
+def request_key(kind, request):
+    """Stable key for a provider call"""
+    payload = json.dumps({"kind": kind, "request": request}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def loose_key(kind, request):
+    """
+    Key on the main input only (prompt or search query).
+
+    Used as a fallback in replay so a call still matches if incidental
+    parameters (e.g. the planned search depth) differ from the recording.
+    """
+    return request_key(kind, request.get("prompt", request.get("query")))
+
+
+class Cassette:
+    """
+    Recorded provider calls, appended as gzipped JSON lines.
+
+    Each entry holds the call kind ("llm" or "search"), the request, the
+    response and how long the call took. In replay mode entries with the
+    same key are served in recorded order, wrapping around when exhausted.
+    """
+
+    def __init__(self, path=CASSETTE_PATH, latency_scale=CASSETTE_LATENCY_SCALE):
+        self.path = path
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._file = None
+        self._entries = defaultdict(list)
+        self._loose = defaultdict(list)
+        self._positions = defaultdict(int)
+
+    # --- recording ---
+
+    def record(self, kind, request, response, duration_s):
+        entry = {
+            "kind": kind,
+            "key": request_key(kind, request),
+            "request": request,
+            "response": response,
+            "duration_s": round(duration_s, 4),
+            "ts": time.time(),
+        }
+        line = (json.dumps(entry, default=str) + "\n").encode()
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                # Appending starts a new gzip member; gzip readers handle that transparently
+                self._file = gzip.open(self.path, "ab")
+                atexit.register(self.close)
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # --- replay ---
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self._entries[entry["key"]].append(entry)
+                self._loose[loose_key(entry["kind"], entry["request"])].append(entry)
+        return self
+
+    def lookup(self, kind, request):
+        """Next recorded entry for this call"""
+        for index, key in (
+            (self._entries, request_key(kind, request)),
+            (self._loose, loose_key(kind, request)),
+        ):
+            entries = index.get(key)
+            if entries:
+                with self._lock:
+                    position = self._positions[key]
+                    self._positions[key] = position + 1
+                return entries[position % len(entries)]
+        raise CassetteMiss(f"No recorded {kind} call for {request!r:.200}")
+
+    async def replay(self, kind, request):
+        entry = self.lookup(kind, request)
+        if self.latency_scale > 0:
+            await asyncio.sleep(entry["duration_s"] * self.latency_scale)
+        return entry["response"]
+
+
+class ReplayedMessage:
+    """Stand-in for a LangChain AIMessage built from a recording"""
+
+    def __init__(self, content, usage_metadata=None):
+        self.content = content
+        self.usage_metadata = usage_metadata or {}
+
+
+class RecordingLLM:
+    """Wrap a chat model and record every ainvoke() call"""
+
+    def __init__(self, llm, cassette):
+        self.llm = llm
+        self.cassette = cassette
+
+    async def ainvoke(self, prompt, **kwargs):
+        start = time.perf_counter()
+        response = await self.llm.ainvoke(prompt, **kwargs)
+        self.cassette.record(
+            "llm",
+            {"prompt": prompt},
+            {
+                "content": response.content,
+                "usage_metadata": dict(getattr(response, "usage_metadata", None) or {}),
+            },
+            time.perf_counter() - start,
+        )
+        return response
+
+
+class ReplayLLM:
+    """Serve recorded chat model responses without calling Groq"""
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    async def ainvoke(self, prompt, **kwargs):
+        response = await self.cassette.replay("llm", {"prompt": prompt})
+        return ReplayedMessage(response["content"], response.get("usage_metadata"))
+
+
+class RecordingSearch:
+    """Wrap a Tavily async client and record every search() call"""
+
+    def __init__(self, client, cassette):
+        self.client = client
+        self.cassette = cassette
+
+    async def search(self, query, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.search(query=query, **kwargs)
+        self.cassette.record(
+            "search", {"query": query, **kwargs}, response, time.perf_counter() - start
+        )
+        return response
+
+
+class ReplaySearch:
+    """Serve recorded Tavily responses without network access"""
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    async def search(self, query, **kwargs):
+        return await self.cassette.replay("search", {"query": query, **kwargs})
+
+
+_cassette = None
+
+
+def get_cassette():
+    """Process-wide cassette for the configured mode (loaded on first use)"""
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette()
+        if CASSETTE_MODE == "replay":
+            _cassette.load()
+    return _cassette
+
+
+def intercept_llm(factory):
+    """Chat model for the current cassette mode; `factory` builds the real one"""
+    if CASSETTE_MODE == "replay":
+        return ReplayLLM(get_cassette())
+    if CASSETTE_MODE == "record":
+        return RecordingLLM(factory(), get_cassette())
+    return factory()
+
+
+def intercept_search(factory):
+    """Search client for the current cassette mode; `factory` builds the real one"""
+    if CASSETTE_MODE == "replay":
+        return ReplaySearch(get_cassette())
+    if CASSETTE_MODE == "record":
+        return RecordingSearch(factory(), get_cassette())
+    return factory()
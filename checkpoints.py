@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import time
+
+# Where graph checkpoints are stored and how long they are kept
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+CHECKPOINT_TTL_HOURS = float(os.getenv("CHECKPOINT_TTL_HOURS", "24"))
+
+
+class CheckpointStore:
+    """
+    SQLite-backed LangGraph checkpointer keyed by idempotency key.
+
+    Each idempotency key is used as the LangGraph thread_id, so a retried
+    request resumes from the last node that completed and a duplicate of a
+    finished request gets the stored final state back. A small side table
+    records when each key was first seen, and for which request, so old
+    threads can be collected and a key reused for another request refused.
+    """
+
+    def __init__(self, path=CHECKPOINT_DB, ttl_hours=CHECKPOINT_TTL_HOURS):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.conn = None
+        self.saver = None
+
+    async def open(self):
+        # Imported lazily: only requests with an idempotency key need them
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        self.conn = await aiosqlite.connect(self.path)
+        # WAL keeps per-node checkpoint writes cheap and lets readers run alongside
+        await self.conn.execute("PRAGMA journal_mode=WAL")
+        await self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.saver = AsyncSqliteSaver(self.conn)
+        await self.saver.setup()
+        await self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                request_hash TEXT
+            )"""
+        )
+        async with self.conn.execute("PRAGMA table_info(idempotency_keys)") as cursor:
+            columns = [row[1] async for row in cursor]
+        if "request_hash" not in columns:
+            # Stores created before keys were bound to their request
+            await self.conn.execute("ALTER TABLE idempotency_keys ADD COLUMN request_hash TEXT")
+        await self.conn.commit()
+        return self
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
+
+    async def touch(self, key, fingerprint):
+        """
+        Remember when a key was first used and for which request (later uses
+        keep the original time); False if it was first used for another request
+        """
+        await self.conn.execute(
+            "INSERT OR IGNORE INTO idempotency_keys (key, created_at, request_hash) VALUES (?, ?, ?)",
+            (key, time.time(), fingerprint),
+        )
+        await self.conn.commit()
+        async with self.conn.execute(
+            "SELECT request_hash FROM idempotency_keys WHERE key = ?", (key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return row[0] is None or row[0] == fingerprint
+
+    async def collect_garbage(self):
+        """Delete checkpoints for keys older than the TTL; returns how many were removed"""
+        cutoff = time.time() - self.ttl_seconds
+        async with self.conn.execute(
+            "SELECT key FROM idempotency_keys WHERE created_at < ?", (cutoff,)
+        ) as cursor:
+            expired = [row[0] async for row in cursor]
+
+        for key in expired:
+            await self.saver.adelete_thread(key)
+        await self.conn.execute(
+            "DELETE FROM idempotency_keys WHERE created_at < ?", (cutoff,)
+        )
+        await self.conn.commit()
+        return len(expired)
+
+
+def request_hash(query, conversation_id=None):
+    """Fingerprint of the request an idempotency key was first used for"""
+    body = json.dumps([query, conversation_id], ensure_ascii=False)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def thread_config(key):
+    """LangGraph run config that stores checkpoints under the idempotency key"""
+    return {"configurable": {"thread_id": key}}
+
+
+async def resume_point(graph, key):
+    """
+    Decide how to (re)run a request for this idempotency key.
+
+    Returns ("done", state) if a previous run finished, ("resume", None) if
+    a previous run stopped part-way, or ("new", None) if the key is unseen.
+    Passing None as the graph input makes LangGraph continue from the last
+    saved checkpoint instead of starting over.
+    """
+    snapshot = await graph.aget_state(thread_config(key))
+    if not snapshot.values:
+        return "new", None
+    if snapshot.next:
+        return "resume", None
+    return "done", snapshot.values
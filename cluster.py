@@ -0,0 +1,421 @@
+import asyncio
+import bisect
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+from refresher import query_key
+
+logger = logging.getLogger(__name__)
+
+# Base URLs of every node in the cluster, this one included, e.g.
+#   CLUSTER_PEERS=http://10.0.0.1:8000,http://10.0.0.2:8000
+# Cluster mode is off unless these and CLUSTER_SECRET are all set.
+CLUSTER_PEERS = os.getenv("CLUSTER_PEERS", "")
+CLUSTER_SELF = os.getenv("CLUSTER_SELF", "")
+
+# Shared by every node and sent on requests between them; a request only
+# counts as coming from a peer if it carries the secret
+CLUSTER_SECRET = os.getenv("CLUSTER_SECRET", "")
+
+# Current membership, written by POST /cluster/members and picked up by
+# every worker on the host; overrides CLUSTER_PEERS once it exists
+CLUSTER_MEMBERS_FILE = os.getenv("CLUSTER_MEMBERS_FILE", "cluster_members.json")
+
+# Points per node on the ring; more points spread keys more evenly
+CLUSTER_VNODES = int(os.getenv("CLUSTER_VNODES", "160"))
+
+# A peer that could not be reached is skipped for this long (seconds)
+PEER_RETRY_S = 10
+
+# Answer fetches from peers give up after this long (seconds), and at most
+# this many run at once; a miss beyond that is a plain 404
+PEER_FETCH_TIMEOUT_S = 2.0
+MAX_PEER_FETCHES = 8
+
+# How often workers check the membership file for changes (seconds)
+MEMBERS_CHECK_INTERVAL_S = 1.0
+
+# Set on requests forwarded between nodes, so they are never forwarded again
+FORWARDED_HEADER = "x-cluster-forwarded"
+SECRET_HEADER = "x-cluster-secret"
+
+# Requests routed to their owner node
+FORWARDED_PATHS = ("/ask", "/ask/stream")
+
+# Request headers passed on to the owner
+PASSED_HEADERS = ("content-type", "x-api-key", "idempotency-key", "accept")
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def parse_peers(peers):
+    if isinstance(peers, str):
+        peers = peers.split(",")
+    return sorted({peer.strip().rstrip("/") for peer in peers if peer.strip()})
+
+
+class HashRing:
+    """
+    Consistent hash ring with virtual nodes.
+
+    Each node owns the arcs before its CLUSTER_VNODES points, so adding or
+    removing one node only moves the keys on that node's arcs (about 1/N
+    of them) instead of reshuffling everything.
+    """
+
+    def __init__(self, nodes, vnodes=CLUSTER_VNODES):
+        self.nodes = list(nodes)
+        self.vnodes = vnodes
+        points = sorted(
+            (ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes)
+        )
+        self.hashes = [h for h, _ in points]
+        self.owners = [node for _, node in points]
+
+    def owner(self, key):
+        if not self.hashes:
+            return None
+        i = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.owners[i]
+
+    def shares(self):
+        """Fraction of the key space each node owns"""
+        shares = dict.fromkeys(self.nodes, 0.0)
+        space = 2 ** 64
+        for i, h in enumerate(self.hashes):
+            previous = self.hashes[i - 1] if i else self.hashes[-1] - space
+            shares[self.owners[i]] += (h - previous) / space
+        return shares
+
+
+def routing_key(payload):
+    """
+    Key that decides which node owns a request.
+
+    Turns of a conversation all go to one node, since its turns are stored
+    there; other queries are spread by their normalized text, so repeats of
+    a query meet the same answer cache.
+    """
+    if payload.get("conversation_id"):
+        return f"conversation:{payload['conversation_id']}"
+    if payload.get("query"):
+        return query_key(payload["query"])
+    return None
+
+
+class Cluster:
+    """
+    Membership and ownership for cluster mode.
+
+    Every node builds the same ring from the same peer list, so any node
+    can tell which one owns a key without coordination. Unreachable peers
+    are taken off the ring for PEER_RETRY_S, which hands their keys to the
+    next node along until they come back.
+
+    Ownership is per node, but the answer cache and the table of in-flight
+    runs live in each worker's memory, so every node must run a single
+    worker for repeats of a query to share one cache and one run.
+    """
+
+    def __init__(self, peers=CLUSTER_PEERS, self_url=CLUSTER_SELF, members_file=CLUSTER_MEMBERS_FILE,
+                 secret=CLUSTER_SECRET):
+        self.self_url = self_url.strip().rstrip("/")
+        self.secret = secret
+        self.members_file = members_file
+        self._lock = threading.Lock()
+        self.peers = parse_peers(peers)
+        self.members_mtime = None
+        self.members_checked_at = 0.0
+        self.down = {}
+        self.forwarded = 0
+        self.fallbacks = 0
+        self.fetching = 0
+        self._client = None
+        self._ring = None
+        self._check_members_file(force=True)
+        if self.self_url and len(self.peers) > 1 and not self.secret:
+            logger.warning("CLUSTER_SECRET is not set; cluster mode is off")
+
+    @property
+    def enabled(self):
+        return bool(self.self_url and self.secret and len(self.peers) > 1)
+
+    def from_peer(self, headers):
+        """True if a request carries this cluster's secret, i.e. was sent by another node"""
+        offered = headers.get(SECRET_HEADER, "")
+        return bool(self.secret) and hmac.compare_digest(offered.encode(), self.secret.encode())
+
+    def peer_headers(self):
+        return {FORWARDED_HEADER: self.self_url, SECRET_HEADER: self.secret}
+
+    # --- membership ---
+
+    def _check_members_file(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.members_checked_at < MEMBERS_CHECK_INTERVAL_S:
+            return
+        self.members_checked_at = now
+        try:
+            mtime = os.stat(self.members_file).st_mtime
+        except OSError:
+            return
+        if mtime == self.members_mtime:
+            return
+        try:
+            with open(self.members_file, encoding="utf-8") as f:
+                peers = parse_peers(json.load(f)["peers"])
+        except (OSError, ValueError, KeyError):
+            logger.warning("Ignoring unreadable %s", self.members_file)
+            return
+        with self._lock:
+            self.members_mtime = mtime
+            if peers != self.peers:
+                logger.info("Cluster membership changed: %s", peers)
+                self.peers = peers
+                self._ring = None
+
+    def set_peers(self, peers):
+        """Replace the membership for every worker on this host (written atomically)"""
+        peers = parse_peers(peers)
+        tmp = f"{self.members_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"peers": peers}, f)
+        os.replace(tmp, self.members_file)
+        self._check_members_file(force=True)
+        return peers
+
+    def ring(self):
+        self._check_members_file()
+        now = time.monotonic()
+        with self._lock:
+            recovered = [peer for peer, until in self.down.items() if until <= now]
+            for peer in recovered:
+                del self.down[peer]
+            if self._ring is None or recovered:
+                live = [peer for peer in self.peers if peer not in self.down or peer == self.self_url]
+                self._ring = HashRing(live)
+            return self._ring
+
+    def mark_down(self, peer):
+        logger.warning("Cluster peer %s unreachable; serving its keys elsewhere for %ss", peer, PEER_RETRY_S)
+        with self._lock:
+            self.down[peer] = time.monotonic() + PEER_RETRY_S
+            self._ring = None
+
+    def owner(self, key):
+        return self.ring().owner(key) or self.self_url
+
+    # --- talking to peers ---
+
+    def client(self):
+        """Pooled HTTP client for forwarding (httpx is imported on first use)"""
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                # Fail over quickly to local handling, but never cut off a graph
+                # run: a forwarded request ends when its client leaves
+                timeout=httpx.Timeout(None, connect=1.0, pool=5.0),
+                limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+            )
+        return self._client
+
+    async def fetch_answer(self, answer_id):
+        """
+        A published answer's JSON body from whichever peer has it, or None.
+
+        Peers are asked at once with a short timeout, and only
+        MAX_PEER_FETCHES lookups run at a time, so requests for unknown ids
+        cannot pile up outbound traffic.
+        """
+        import httpx
+
+        peers = [peer for peer in self.ring().nodes if peer != self.self_url]
+        if not peers or self.fetching >= MAX_PEER_FETCHES:
+            return None
+
+        async def fetch(peer):
+            try:
+                response = await self.client().get(
+                    f"{peer}/answers/{answer_id}", headers=self.peer_headers(), timeout=PEER_FETCH_TIMEOUT_S
+                )
+            except httpx.TimeoutException:
+                return None
+            except httpx.TransportError:
+                self.mark_down(peer)
+                return None
+            return response.content if response.status_code == 200 else None
+
+        self.fetching += 1
+        try:
+            bodies = await asyncio.gather(*(fetch(peer) for peer in peers))
+        finally:
+            self.fetching -= 1
+        return next((body for body in bodies if body is not None), None)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def status(self):
+        ring = self.ring()
+        now = time.monotonic()
+        with self._lock:
+            down = {peer: round(until - now, 1) for peer, until in self.down.items()}
+        return {
+            "enabled": self.enabled,
+            "self": self.self_url,
+            "peers": self.peers,
+            "down": down,
+            "vnodes": ring.vnodes,
+            "key_share": {node: round(share, 3) for node, share in ring.shares().items()},
+            "forwarded": self.forwarded,
+            "fallbacks": self.fallbacks,
+        }
+
+
+class ClusterMiddleware:
+    """
+    Sends /ask and /ask/stream to the node that owns the query.
+
+    Requests owned by another node are forwarded there (marked with
+    X-Cluster-Forwarded and the cluster secret so they are handled on
+    arrival), and the owner's response is relayed back, streamed for
+    /ask/stream. If the owner cannot be reached, or drops the connection
+    before answering, the request is handled locally instead. A client that
+    leaves closes the forwarded request, which cancels the owner's run.
+    """
+
+    def __init__(self, app, cluster):
+        from starlette.datastructures import Headers
+
+        self.app = app
+        self.cluster = cluster
+        self.Headers = Headers
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in FORWARDED_PATHS
+            or not self.cluster.enabled
+        ):
+            await self.app(scope, receive, send)
+            return
+        headers = self.Headers(scope=scope)
+        if self.cluster.from_peer(headers):
+            await self.app(scope, receive, send)
+            return
+
+        body = await read_body(receive)
+        try:
+            key = routing_key(json.loads(body))
+        except (ValueError, AttributeError):
+            key = None
+        owner = self.cluster.owner(key) if key else self.cluster.self_url
+        if owner != self.cluster.self_url and await self.forward(owner, scope, receive, headers, body, send):
+            return
+        await self.app(scope, replay_body(body, receive), send)
+
+    async def forward(self, owner, scope, receive, headers, body, send):
+        """Relay the request to its owner until done or the client leaves; False to handle it locally"""
+        relay = asyncio.ensure_future(self.relay(owner, scope, headers, body, send))
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            await asyncio.wait({relay, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+            if not relay.done():
+                # Cancelling the relay closes the upstream request, so the owner stops its run too
+                relay.cancel()
+                await asyncio.gather(relay, return_exceptions=True)
+        return True if relay.cancelled() else relay.result()
+
+    async def relay(self, owner, scope, headers, body, send):
+        import httpx
+
+        client = self.cluster.client()
+        forward_headers = {name: headers[name] for name in PASSED_HEADERS if name in headers}
+        forward_headers.update(self.cluster.peer_headers())
+        # Our own CompressionMiddleware encodes the relayed body for the client
+        forward_headers["accept-encoding"] = "identity"
+        request = client.build_request("POST", f"{owner}{scope['path']}", content=body, headers=forward_headers)
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.TransportError:
+            self.cluster.mark_down(owner)
+            self.cluster.fallbacks += 1
+            return False
+
+        try:
+            streamed = scope["path"] == "/ask/stream"
+            relayed = [
+                (name.encode(), value.encode()) for name, value in response.headers.items()
+                if name not in ("content-length", "transfer-encoding", "connection", "content-encoding")
+            ]
+            relayed.append((b"x-cluster-owner", owner.encode()))
+            if not streamed:
+                try:
+                    content = await response.aread()
+                except httpx.TransportError:
+                    # Nothing has been sent to the client yet, so it can still be answered here
+                    logger.warning("Cluster peer %s dropped a forwarded request; handling it locally", owner)
+                    self.cluster.fallbacks += 1
+                    return False
+                relayed.append((b"content-length", str(len(content)).encode()))
+            self.cluster.forwarded += 1
+            await send({"type": "http.response.start", "status": response.status_code, "headers": relayed})
+            if streamed:
+                try:
+                    async for chunk in response.aiter_raw():
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                except httpx.TransportError:
+                    logger.warning("Cluster peer %s dropped a forwarded stream", owner)
+                    error = {"type": "error", "detail": "Lost the connection to the node running this query"}
+                    await send({"type": "http.response.body", "body": json.dumps(error).encode() + b"\n", "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+            else:
+                await send({"type": "http.response.body", "body": content})
+        finally:
+            await response.aclose()
+        return True
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def wait_for_disconnect(receive):
+    """Return once the client has gone (the request body must already be read)"""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def replay_body(body, receive):
+    """receive() that hands the already-read body to the app, then defers to the client"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
@@ -0,0 +1,249 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# SQLite file holding conversation turns (shared by all workers on a host)
+CONVERSATION_DB = os.getenv("CONVERSATION_DB", "conversations.sqlite")
+
+# Conversations with no new turn for this long are deleted
+CONVERSATION_TTL_HOURS = float(os.getenv("CONVERSATION_TTL_HOURS", "72"))
+
+# Upper bound on the conversation context added to prompts, in tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Each turn's answer is clipped to this many characters in the context
+TURN_ANSWER_CHARS = 600
+
+# Follow-ups reuse the previous search's sources when at least this share of
+# their terms (and at least MIN_SHARED_TERMS of them) also appeared in its
+# query, and every term of theirs appears somewhere in those sources
+TOPIC_OVERLAP = 0.5
+MIN_SHARED_TERMS = 2
+
+# A question with this many terms, no pronoun and nothing in common with the
+# last RECENT_TURNS turns is taken as a new topic and answered without context
+STANDALONE_MIN_TERMS = 3
+RECENT_TURNS = 3
+
+STOPWORDS = set("""
+a about after all also an and any are as at be been but by can could did do does
+for from had has have how i if in into is it its just like me more most my no not
+now of on or our out so some such than that the their them then there these they
+this to up us was we were what when where which who why will with would you your
+tell explain give show please more about
+""".split())
+FOLLOW_UP_WORDS = {"it", "its", "they", "them", "their", "that", "this", "those", "these", "he", "she", "his", "her"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    conversation_id TEXT NOT NULL,
+    turn INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    query TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, turn)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    conversation_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    through_turn INTEGER NOT NULL
+);
+"""
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def topic_terms(text):
+    words = re.findall(r"[a-z0-9][a-z0-9+#.-]*", text.lower())
+    return {word for word in words if word not in STOPWORDS and len(word) > 2}
+
+
+def sources_cover(sources, terms):
+    """True if every term appears in the text of the sources"""
+    text = " ".join(f"{source.get('url', '')} {source.get('content', '')}" for source in sources).lower()
+    return all(term in text for term in terms)
+
+
+def render_turn(turn):
+    answer = turn["answer"]
+    if len(answer) > TURN_ANSWER_CHARS:
+        answer = answer[:TURN_ANSWER_CHARS] + "..."
+    return f"User: {turn['query']}\nAssistant: {answer}"
+
+
+class ConversationStore:
+    """
+    Turns of multi-turn research conversations, kept in SQLite.
+
+    The context for a new turn is the rolling summary of older turns plus
+    as many recent turns as fit in CONTEXT_TOKEN_BUDGET. Turns that no
+    longer fit are folded into the summary (see fold()), so prompt size
+    stays bounded however long the conversation runs. Conversations idle
+    for longer than the TTL are removed by collect_garbage().
+    """
+
+    def __init__(self, path=CONVERSATION_DB, budget=CONTEXT_TOKEN_BUDGET, ttl_hours=CONVERSATION_TTL_HOURS):
+        self.budget = budget
+        self.ttl_seconds = ttl_hours * 3600
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def _summary(self, conversation_id):
+        row = self.conn.execute(
+            "SELECT summary, through_turn FROM summaries WHERE conversation_id = ?",
+            (conversation_id,),
+        ).fetchone()
+        return (row["summary"], row["through_turn"]) if row else ("", 0)
+
+    def _turns_after(self, conversation_id, turn):
+        return [dict(row) for row in self.conn.execute(
+            "SELECT * FROM turns WHERE conversation_id = ? AND turn > ? ORDER BY turn",
+            (conversation_id, turn),
+        )]
+
+    def context(self, conversation_id):
+        """
+        Conversation context for the next turn.
+
+        Returns (context text, turns that did not fit in the budget and
+        should be folded into the summary).
+        """
+        with self._lock:
+            summary, through = self._summary(conversation_id)
+            turns = self._turns_after(conversation_id, through)
+
+        budget = self.budget - estimate_tokens(summary)
+        recent = []
+        for turn in reversed(turns):
+            rendered = render_turn(turn)
+            cost = estimate_tokens(rendered)
+            if cost > budget:
+                break
+            recent.insert(0, rendered)
+            budget -= cost
+
+        overflow = turns[: len(turns) - len(recent)]
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation: {summary}")
+        parts.extend(recent)
+        return "\n\n".join(parts), overflow
+
+    def related(self, conversation_id, query):
+        """
+        How a new query relates to the conversation so far.
+
+        Returns (standalone, sources). `standalone` is True for a
+        self-contained question on a new topic, which needs no conversation
+        context (and can then share cached answers). `sources` are the
+        results of the last searched turn when the query is a follow-up on
+        its topic: enough shared terms, or a short pronoun-led question such
+        as "what about its population?" right after that turn that shares at
+        least one term with it. Either way the sources must mention every
+        term of the query, otherwise it gets a new search.
+        """
+        with self._lock:
+            recent = [dict(row) for row in self.conn.execute(
+                """SELECT turn, topic, sources FROM turns WHERE conversation_id = ?
+                   ORDER BY turn DESC LIMIT ?""",
+                (conversation_id, RECENT_TURNS),
+            )]
+            searched = self.conn.execute(
+                """SELECT turn, topic, sources FROM turns
+                   WHERE conversation_id = ? AND sources != '[]'
+                   ORDER BY turn DESC LIMIT 1""",
+                (conversation_id,),
+            ).fetchone()
+
+        current = topic_terms(query)
+        words = set(re.findall(r"[a-z']+", query.lower()))
+        has_pronoun = bool(words & FOLLOW_UP_WORDS)
+        recent_terms = set().union(*(json.loads(turn["topic"]) for turn in recent)) if recent else set()
+        standalone = (
+            not recent
+            or (not has_pronoun and len(current) >= STANDALONE_MIN_TERMS and not current & recent_terms)
+        )
+        if searched is None or standalone:
+            return standalone, None
+
+        shared = set(json.loads(searched["topic"])) & current
+        on_topic = len(shared) >= min(MIN_SHARED_TERMS, len(current)) and len(shared) >= TOPIC_OVERLAP * len(current)
+        is_follow_up = (
+            has_pronoun and len(current) <= 3 and searched["turn"] == recent[0]["turn"]
+            and (shared or not current)
+        )
+        sources = json.loads(searched["sources"])
+        if ((current and on_topic) or is_follow_up) and sources_cover(sources, current):
+            return False, sources
+        return False, None
+
+    def add_turn(self, conversation_id, query, answer, sources=()):
+        """Append a finished turn (sources are kept so follow-ups can reuse them)"""
+        sources = [
+            {key: source[key] for key in ("url", "content", "score") if key in source}
+            for source in sources
+        ]
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COALESCE(MAX(turn), 0) FROM turns WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+            topic = topic_terms(query)
+            self.conn.execute(
+                "INSERT INTO turns VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (conversation_id, row[0] + 1, time.time(), query, answer,
+                 json.dumps(sorted(topic)[:50]), json.dumps(sources)),
+            )
+            self.conn.commit()
+
+    def collect_garbage(self):
+        """Delete conversations with no turn within the TTL; returns how many were removed"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [row[0] for row in self.conn.execute(
+                "SELECT conversation_id FROM turns GROUP BY conversation_id HAVING MAX(created_at) < ?",
+                (cutoff,),
+            )]
+            self.conn.executemany("DELETE FROM turns WHERE conversation_id = ?", [(c,) for c in expired])
+            self.conn.execute("DELETE FROM summaries WHERE conversation_id NOT IN (SELECT conversation_id FROM turns)")
+            self.conn.commit()
+        return len(expired)
+
+    async def fold(self, conversation_id, overflow, summarize):
+        """
+        Fold turns that no longer fit into the rolling summary.
+
+        `summarize(previous_summary, turns_text)` is an async function that
+        returns the new summary (an LLM call), so this is run in the
+        background after the answer has been returned.
+        """
+        if not overflow:
+            return
+        with self._lock:
+            summary, through = self._summary(conversation_id)
+        overflow = [turn for turn in overflow if turn["turn"] > through]
+        if not overflow:
+            return
+
+        turns_text = "\n\n".join(render_turn(turn) for turn in overflow)
+        new_summary = await summarize(summary, turns_text)
+        # Keep the summary itself within a fraction of the budget
+        max_chars = self.budget * 4 // 3
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)",
+                (conversation_id, new_summary[:max_chars], overflow[-1]["turn"]),
+            )
+            self.conn.commit()
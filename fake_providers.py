@@ -0,0 +1,63 @@
+import asyncio
+import hashlib
+import os
+
+# Simulated provider latency (seconds) when PROVIDER_MODE=fake
+FAKE_LLM_LATENCY_S = float(os.getenv("FAKE_LLM_LATENCY_S", "0.05"))
+FAKE_SEARCH_LATENCY_S = float(os.getenv("FAKE_SEARCH_LATENCY_S", "0.05"))
+
+FAKE_PARAGRAPH = (
+    "This is a stand-in search result used for local benchmarking. It is long "
+    "enough to look like a real snippet so prompt sizes stay realistic. "
+)
+
+
+class FakeMessage:
+    """Shape of a LangChain AIMessage: .content and .usage_metadata"""
+
+    def __init__(self, content, prompt_tokens):
+        self.content = content
+        completion_tokens = len(content) // 4
+        self.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+
+class FakeLLM:
+    """
+    Local stand-in for ChatGroq with a fixed latency.
+
+    Routing prompts get SEARCH or DIRECT chosen deterministically from the
+    prompt, so load spreads over both graph paths without any network.
+    """
+
+    async def ainvoke(self, prompt, **kwargs):
+        await asyncio.sleep(FAKE_LLM_LATENCY_S)
+        if "'SEARCH' or 'DIRECT'" in prompt:
+            digest = hashlib.sha1(prompt.encode()).digest()
+            content = "SEARCH" if digest[0] % 2 else "DIRECT"
+        else:
+            content = "Fake answer. " * 80
+        return FakeMessage(content, len(prompt) // 4)
+
+
+class FakeSearch:
+    """Local stand-in for AsyncTavilyClient with a fixed latency"""
+
+    async def search(self, query, search_depth="basic", max_results=5, **kwargs):
+        await asyncio.sleep(FAKE_SEARCH_LATENCY_S)
+        digest = hashlib.sha1(query.encode()).hexdigest()[:12]
+        return {
+            "query": query,
+            "results": [
+                {
+                    "url": f"https://example.com/{digest}/{i}",
+                    "title": f"Result {i} for {query}",
+                    "content": FAKE_PARAGRAPH * 4,
+                    "score": 0.8,
+                }
+                for i in range(max_results)
+            ],
+        }
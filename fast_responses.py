@@ -0,0 +1,156 @@
+import gzip
+import json
+import os
+
+# Optional speedups: orjson for serialization, brotli for the "br" encoding
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed (the headers would eat the gain)
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+# Levels for responses compressed per request: fast, most of the size win
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+# Levels for stored answers, which are compressed once and served many times
+STORED_GZIP_LEVEL = 9
+STORED_BROTLI_QUALITY = 9
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/x-ndjson")
+
+
+def dumps(obj):
+    """Serialize to JSON bytes (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def canonical_dumps(obj):
+    """Deterministic JSON bytes (sorted keys), so equal content always hashes the same"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode()
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding):
+    """
+    Best content coding the client accepts: "br", "gzip" or None.
+
+    Honours q-values, so "gzip;q=0" or "br;q=0" rule an encoding out.
+    """
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in available_encodings():
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding, stored=False):
+    if encoding == "br":
+        return brotli.compress(body, quality=STORED_BROTLI_QUALITY if stored else BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=STORED_GZIP_LEVEL if stored else GZIP_LEVEL, mtime=0)
+    return body
+
+
+def is_compressible(content_type):
+    return any(content_type.startswith(prefix) for prefix in COMPRESSIBLE_TYPES)
+
+
+def json_response(content, status_code=200, headers=None):
+    """
+    JSON response serialized with dumps().
+
+    Returning this from an endpoint skips FastAPI's response_model
+    validation and jsonable_encoder pass, which dominate the cost of
+    sending a long answer.
+    """
+    from starlette.responses import Response
+
+    return Response(dumps(content), status_code=status_code, headers=headers, media_type="application/json")
+
+
+class CompressionMiddleware:
+    """
+    gzip/brotli compression negotiated from Accept-Encoding.
+
+    Only complete bodies are compressed: streamed responses (NDJSON
+    progress) pass through untouched so each event still reaches the client
+    as soon as it is sent. Responses that already carry a Content-Encoding
+    (pre-compressed stored answers) are left alone.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_BYTES):
+        from starlette.datastructures import Headers, MutableHeaders
+
+        self.app = app
+        self.minimum_size = minimum_size
+        self.Headers = Headers
+        self.MutableHeaders = MutableHeaders
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(self.Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            headers = self.MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            compressible = is_compressible(headers.get("content-type", ""))
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            if (
+                not compressible
+                or message.get("more_body", False)
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+            ):
+                await send(start)
+                await send(message)
+            else:
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+            start = None
+
+        await self.app(scope, receive, send_compressed)
@@ -1,7 +1,12 @@
 import streamlit as st
 import requests
+import math
+import uuid
 from datetime import datetime
 
+from history_store import HistoryStore, owner_id
+from backend_client import BackendClient, BackendError
+
 # Page configuration
 st.set_page_config(
     page_title="AI Research Assistant",
@@ -51,6 +56,29 @@ st.markdown("""
 # API endpoint
 API_URL = "http://localhost:8000"
 
+# History items shown per page
+HISTORY_PAGE_SIZE = 5
+
+@st.cache_resource
+def get_history_store():
+    """Persistent research history (same file as main_langgraph_langsmith.py)"""
+    return HistoryStore()
+
+history = get_history_store()
+
+# Each browser session sees only its own history. The owner id lives in the
+# URL, so a reload or a bookmark returns to the same history.
+history_owner = owner_id(st.query_params.get("history"))
+if st.query_params.get("history") != history_owner:
+    st.query_params["history"] = history_owner
+
+@st.cache_resource
+def get_backend_client():
+    """One pooled connection to the backend per Streamlit server process"""
+    return BackendClient(API_URL)
+
+backend = get_backend_client()
+
 # Header
 st.markdown('<div class="main-header">🔍 AI Research Assistant</div>', unsafe_allow_html=True)
 st.markdown('<div class="sub-header">Powered by LangGraph + Groq + Tavily</div>', unsafe_allow_html=True)
@@ -79,16 +107,17 @@ with st.sidebar:
     
     st.divider()
     
-    # Check API health
-    try:
-        response = requests.get(f"{API_URL}/health", timeout=2)
-        if response.status_code == 200:
-            st.success("✅ Backend Connected")
-        else:
-            st.error("⚠️ Backend Issue")
-    except:
+    # Check API health (cached and refreshed in the background, never blocks)
+    health = backend.health()
+    if health == "connected":
+        st.success("✅ Backend Connected")
+    elif health == "issue":
+        st.error("⚠️ Backend Issue")
+    elif health == "offline":
         st.error("❌ Backend Offline")
         st.info("Run: `uvicorn backend:app --reload`")
+    else:
+        st.info("⏳ Checking backend...")
 
 # Main content
 col1, col2 = st.columns([2, 1])
@@ -100,6 +129,11 @@ with col1:
     if 'selected_example' not in st.session_state:
         st.session_state.selected_example = ""
     
+    # Questions in one session form a conversation, so follow-ups can say "it"
+    if 'conversation_id' not in st.session_state:
+        st.session_state.conversation_id = str(uuid.uuid4())
+        st.session_state.conversation_turns = 0
+    
     # Example questions (placed BEFORE the text area)
     st.caption("**Try these examples:**")
     example_col1, example_col2 = st.columns(2)
@@ -131,6 +165,19 @@ with col1:
     
     # Submit button
     submit_button = st.button("🚀 Get Answer", type="primary", use_container_width=True)
+    
+    if st.session_state.conversation_turns:
+        st.caption(f"💬 Follow-up questions continue this conversation ({st.session_state.conversation_turns} turns so far)")
+        if st.button("🆕 New conversation"):
+            st.session_state.conversation_id = str(uuid.uuid4())
+            st.session_state.conversation_turns = 0
+            st.rerun()
+    
+    # "Re-research" from the history asks the backend again on request
+    forced_query = st.session_state.pop('force_query', None)
+    if forced_query:
+        user_query = forced_query
+        submit_button = True
 
 with col2:
     st.header("📊 Stats")
@@ -146,77 +193,125 @@ with col2:
 
 # Process query
 if submit_button and user_query:
-    with st.spinner("🤔 Processing your query..."):
-        try:
-            # Call FastAPI backend
-            response = requests.post(
-                f"{API_URL}/ask",
-                json={"query": user_query},
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Update stats
-                st.session_state.query_count += 1
-                if result["needs_search"]:
-                    st.session_state.search_count += 1
-                
-                # Display query
-                st.markdown("---")
-                st.markdown(f'<div class="query-box"><strong>📝 Your Question:</strong><br>{result["query"]}</div>', unsafe_allow_html=True)
-                
-                # Display steps
-                st.subheader("🔄 Processing Steps")
-                for step in result["steps"]:
-                    st.markdown(f'<div class="step-box">{step}</div>', unsafe_allow_html=True)
-                
-                # Display answer
-                st.subheader("💡 Answer")
-                st.markdown(f'<div class="answer-box">{result["final_answer"]}</div>', unsafe_allow_html=True)
-                
-                # Add to history
-                if 'history' not in st.session_state:
-                    st.session_state.history = []
-                
-                st.session_state.history.append({
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "query": result["query"],
-                    "answer": result["final_answer"],
-                    "used_search": result["needs_search"]
-                })
-                
-                # Download button
-                st.download_button(
-                    label="📥 Download Answer",
-                    data=f"Query: {result['query']}\n\nAnswer: {result['final_answer']}",
-                    file_name=f"answer_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                    mime="text/plain"
-                )
-            
-            else:
-                st.error(f"❌ Error: {response.json().get('detail', 'Unknown error')}")
+    st.session_state.replay_id = None
+    try:
+        # Display query
+        st.markdown("---")
+        st.markdown(f'<div class="query-box"><strong>📝 Your Question:</strong><br>{user_query}</div>', unsafe_allow_html=True)
+        
+        # Display steps as the backend finishes them
+        st.subheader("🔄 Processing Steps")
+        steps_area = st.container()
+        result = None
+        with st.spinner("🤔 Processing your query..."):
+            for event in backend.ask_stream(user_query, st.session_state.conversation_id):
+                if event["type"] == "step":
+                    steps_area.markdown(f'<div class="step-box">{event["step"]}</div>', unsafe_allow_html=True)
+                elif event["type"] == "result":
+                    result = event
         
-        except requests.exceptions.ConnectionError:
-            st.error("❌ Cannot connect to backend. Make sure it's running!")
-            st.code("uvicorn backend:app --reload")
-        except Exception as e:
-            st.error(f"❌ Error: {str(e)}")
+        if result is None:
+            raise BackendError("Backend closed the stream without an answer")
+        
+        # Update stats
+        st.session_state.query_count += 1
+        st.session_state.conversation_turns += 1
+        if result["needs_search"]:
+            st.session_state.search_count += 1
+        
+        # Display answer
+        st.subheader("💡 Answer")
+        st.markdown(f'<div class="answer-box">{result["final_answer"]}</div>', unsafe_allow_html=True)
+        
+        # Add to history
+        history.add(
+            history_owner,
+            result["query"],
+            result["final_answer"],
+            result["needs_search"],
+            result["steps"],
+            source="frontend"
+        )
+        
+        # Download button
+        st.download_button(
+            label="📥 Download Answer",
+            data=f"Query: {result['query']}\n\nAnswer: {result['final_answer']}",
+            file_name=f"answer_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+            mime="text/plain"
+        )
+    
+    except BackendError as e:
+        st.error(f"❌ Error: {str(e)}")
+    except requests.exceptions.ConnectionError:
+        st.error("❌ Cannot connect to backend. Make sure it's running!")
+        st.code("uvicorn backend:app --reload")
+    except Exception as e:
+        st.error(f"❌ Error: {str(e)}")
 
 elif submit_button:
     st.warning("⚠️ Please enter a question first!")
 
+# Stored answer picked from the history - served instantly, no backend call
+elif st.session_state.get('replay_id'):
+    item = history.get(history_owner, st.session_state.replay_id)
+    if item:
+        st.markdown("---")
+        st.markdown(f'<div class="query-box"><strong>📝 Your Question:</strong><br>{item["query"]}</div>', unsafe_allow_html=True)
+        st.caption(f"⚡ Served from history (answered {datetime.fromtimestamp(item['created_at']).strftime('%Y-%m-%d %H:%M:%S')})")
+        
+        st.subheader("🔄 Processing Steps")
+        for step in item["steps"]:
+            st.markdown(f'<div class="step-box">{step}</div>', unsafe_allow_html=True)
+        
+        st.subheader("💡 Answer")
+        st.markdown(f'<div class="answer-box">{item["answer"]}</div>', unsafe_allow_html=True)
+        
+        if st.button("🔄 Re-research"):
+            st.session_state.force_query = item["query"]
+            st.session_state.replay_id = None
+            st.rerun()
+
 # Query History
-if 'history' in st.session_state and st.session_state.history:
+if history.count(history_owner):
     st.markdown("---")
     st.header("📜 Query History")
     
-    for idx, item in enumerate(reversed(st.session_state.history[-5:])):  # Show last 5
-        with st.expander(f"🕐 {item['timestamp']} - {item['query'][:50]}..."):
+    history_search = st.text_input(
+        "Search history",
+        placeholder="Words from past questions or answers",
+        key="history_search"
+    )
+    total = history.count(history_owner, history_search)
+    if 'history_page' not in st.session_state:
+        st.session_state.history_page = 0
+    pages = max(1, math.ceil(total / HISTORY_PAGE_SIZE))
+    page = min(st.session_state.history_page, pages - 1)
+    
+    if not total:
+        st.info("No history matches your search.")
+    for item in history.page(history_owner, page, page_size=HISTORY_PAGE_SIZE, search=history_search):
+        timestamp = datetime.fromtimestamp(item['created_at']).strftime("%Y-%m-%d %H:%M:%S")
+        with st.expander(f"🕐 {timestamp} - {item['query'][:50]}..."):
             st.write(f"**Query:** {item['query']}")
-            st.write(f"**Used Web Search:** {'Yes ✓' if item['used_search'] else 'No ✗'}")
-            st.write(f"**Answer:** {item['answer'][:200]}...")
+            st.write(f"**Used Web Search:** {'Yes ✓' if item['needs_search'] else 'No ✗'}")
+            st.write(f"**Answer:** {item['answer_preview']}...")
+            if st.button("📄 Show full answer", key=f"show_{item['id']}"):
+                st.session_state.replay_id = item['id']
+                st.rerun()
+    
+    if pages > 1:
+        prev_col, page_col, next_col = st.columns([1, 4, 1])
+        with prev_col:
+            if st.button("◀ Newer", disabled=page == 0):
+                st.session_state.history_page = page - 1
+                st.rerun()
+        with page_col:
+            st.caption(f"Page {page + 1} of {pages}")
+        with next_col:
+            if st.button("Older ▶", disabled=page >= pages - 1):
+                st.session_state.history_page = page + 1
+                st.rerun()
 
 # Footer
 st.markdown("---")
@@ -1,20 +1,74 @@
 import os
+import time
+import math
+import asyncio
 from typing import TypedDict, Annotated
-from langgraph.graph import StateGraph, END
-from langchain_groq import ChatGroq
-from tavily import TavilyClient
 import operator
 
+from search_planning import plan_search, remaining_budget, results_are_thin, log_outcome
+from query_decomposition import decompose_query, merge_results
+from page_enrichment import ENRICH_PAGES, get_page_fetcher
+from cassettes import intercept_llm, intercept_search
+
+# Maximum number of Tavily searches run at the same time for one query
+SEARCH_FANOUT_CONCURRENCY = int(os.getenv("SEARCH_FANOUT_CONCURRENCY", "4"))
+
 # Initialize clients (will use env variables)
-def get_llm():
+# Clients are built on first use and shared, so connections are reused and
+# langchain_groq / tavily are only imported when a node actually needs them.
+# CASSETTE_MODE=record|replay wraps them to record or replay every call
+_llm = None
+_tavily_client = None
+
+# PROVIDER_MODE=fake swaps in local stand-ins (see fake_providers.py) for benchmarks
+PROVIDER_MODE = os.getenv("PROVIDER_MODE", "live").lower()
+
+def build_llm():
+    if PROVIDER_MODE == "fake":
+        from fake_providers import FakeLLM
+        return FakeLLM()
+    from langchain_groq import ChatGroq
     return ChatGroq(
         model="llama-3.3-70b-versatile",
         temperature=0.3,
         groq_api_key=os.getenv("GROQ_API_KEY")
     )
 
+def build_tavily_client():
+    if PROVIDER_MODE == "fake":
+        from fake_providers import FakeSearch
+        return FakeSearch()
+    from tavily import AsyncTavilyClient
+    return AsyncTavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+
+def preload_dependencies():
+    """
+    Import LangGraph and the provider SDKs now rather than on first use.
+    
+    Called in a pre-fork server process so workers share these modules'
+    memory copy-on-write instead of each importing them separately.
+    """
+    import langgraph.graph  # noqa: F401
+    if PROVIDER_MODE != "fake":
+        import langchain_groq  # noqa: F401
+        import tavily  # noqa: F401
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        _llm = intercept_llm(build_llm)
+    return _llm
+
 def get_tavily_client():
-    return TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+    global _tavily_client
+    if _tavily_client is None:
+        _tavily_client = intercept_search(build_tavily_client)
+    return _tavily_client
+
+def token_count(response):
+    """Total tokens reported by the provider for an LLM response (0 if unknown)"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return usage.get("total_tokens", 0)
 
 # Define State
 class ResearchState(TypedDict):
@@ -23,9 +77,54 @@ class ResearchState(TypedDict):
     search_results: str
     final_answer: str
     steps: Annotated[list[str], operator.add]
+    tokens_used: Annotated[int, operator.add]
+    started_at: float
+    search_plan: dict
+    sub_queries: list[str]
+    sources: list[dict]
+    conversation_id: str
+    conversation_context: str
+    cached_sources: list[dict]
+    search_calls: int
+
+def new_research_state(query: str, conversation_id: str = "", conversation_context: str = "",
+                       cached_sources: list[dict] = None) -> ResearchState:
+    """
+    Initial graph input for a query
+    
+    For a turn of a multi-turn conversation, pass the conversation context
+    (see conversations.py) and, for a follow-up on the same topic, the
+    earlier turn's search results to reuse instead of searching again.
+    """
+    return {
+        "query": query,
+        "needs_search": False,
+        "search_results": "",
+        "final_answer": "",
+        "steps": [],
+        "tokens_used": 0,
+        "started_at": time.time(),
+        "search_plan": {},
+        "sub_queries": [],
+        "sources": [],
+        "conversation_id": conversation_id,
+        "conversation_context": conversation_context,
+        "cached_sources": cached_sources or [],
+        "search_calls": 0
+    }
+
+def with_context(state, prompt):
+    """Prefix a prompt with the conversation so far, if this is a follow-up turn"""
+    context = state.get("conversation_context")
+    if not context:
+        return prompt
+    return f"""Conversation so far:
+{context}
+
+{prompt}"""
 
 # Node 1: Analyze Query
-def analyze_query(state: ResearchState) -> ResearchState:
+async def analyze_query(state: ResearchState) -> ResearchState:
     """Determine if the query needs web search"""
     llm = get_llm()
     query = state["query"]
@@ -40,40 +139,136 @@ Respond with only 'SEARCH' or 'DIRECT'.
 
 Response:"""
     
-    response = llm.invoke(prompt)
+    response = await llm.ainvoke(with_context(state, prompt))
     needs_search = "SEARCH" in response.content.upper()
     
     return {
         **state,
         "needs_search": needs_search,
+        "tokens_used": token_count(response),
         "steps": [f"✓ Analyzed query - {'Needs web search' if needs_search else 'Using knowledge base'}"]
     }
 
-# Node 2: Search Web
-def search_web(state: ResearchState) -> ResearchState:
-    """Search the web using Tavily"""
-    tavily_client = get_tavily_client()
-    query = state["query"]
+# Node 2: Plan Search
+async def plan_search_step(state: ResearchState) -> ResearchState:
+    """Choose search depth and result count for this query"""
+    plan = plan_search(state["query"], remaining_budget(state["started_at"]))
+    
+    return {
+        **state,
+        "search_plan": plan,
+        "tokens_used": 0,
+        "steps": [f"✓ Planned search - {plan['search_depth']} depth, {plan['max_results']} results ({plan['query_type']})"]
+    }
+
+# Node 3: Decompose Query
+async def decompose_step(state: ResearchState) -> ResearchState:
+    """Split comparative / multi-part questions into sub-queries searched in parallel"""
+    sub_queries = decompose_query(state["query"])
+    step = (
+        f"✓ Split query into {len(sub_queries)} sub-queries"
+        if len(sub_queries) > 1 else "✓ Query searched as a whole"
+    )
+    
+    return {
+        **state,
+        "sub_queries": sub_queries,
+        "tokens_used": 0,
+        "steps": [step]
+    }
+
+async def fan_out_search(tavily_client, sub_queries, depth, max_results):
+    """
+    Run one Tavily search per sub-query concurrently and merge the results.
+    
+    Returns (merged results, wall-clock seconds). Sub-queries that fail are
+    dropped as long as at least one succeeds.
+    """
+    semaphore = asyncio.Semaphore(SEARCH_FANOUT_CONCURRENCY)
+    per_query = max_results if len(sub_queries) == 1 else max(2, math.ceil(max_results / len(sub_queries)))
     
-    search_response = tavily_client.search(
-        query=query,
-        max_results=3
+    async def search_one(sub_query):
+        async with semaphore:
+            search_response = await tavily_client.search(
+                query=sub_query,
+                search_depth=depth,
+                max_results=per_query
+            )
+            return search_response['results']
+    
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(search_one(sub_query) for sub_query in sub_queries),
+        return_exceptions=True
     )
+    latency = time.perf_counter() - start
     
-    # Format results
-    results = "\n\n".join([
-        f"Source: {result['url']}\n{result['content']}"
-        for result in search_response['results']
+    result_lists = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+    if not result_lists:
+        raise outcomes[0]
+    return merge_results(result_lists), latency
+
+def format_sources(sources):
+    """Format search results for the synthesis prompt, preferring full page text"""
+    return "\n\n".join([
+        f"Source: {source['url']}\n{source.get('page_text') or source['content']}"
+        for source in sources
     ])
+
+# Node 4: Search Web
+async def search_web(state: ResearchState) -> ResearchState:
+    """Search the web using Tavily, escalating to an advanced search if results are thin"""
+    query = state["query"]
+    if state.get("cached_sources"):
+        # Follow-up on the same topic: the earlier turn's results still apply
+        found = state["cached_sources"]
+        return {
+            **state,
+            "search_results": format_sources(found),
+            "sources": found,
+            "tokens_used": 0,
+            "search_calls": 0,
+            "steps": [f"✓ Reused {len(found)} sources from earlier in the conversation"]
+        }
+    
+    tavily_client = get_tavily_client()
+    sub_queries = state["sub_queries"] or [query]
+    plan = state["search_plan"] or plan_search(query, remaining_budget(state["started_at"]))
+    depth = plan["search_depth"]
+    
+    found, latency = await fan_out_search(tavily_client, sub_queries, depth, plan["max_results"])
+    escalate = plan["allow_escalation"] and results_are_thin(found)
+    log_outcome(query, plan, depth, found, latency, escalated=escalate)
+    
+    if escalate:
+        depth = "advanced"
+        found, latency = await fan_out_search(tavily_client, sub_queries, depth, plan["max_results"])
+        log_outcome(query, plan, depth, found, latency, escalated=True)
     
     return {
         **state,
-        "search_results": results,
-        "steps": [f"✓ Searched the web - Found {len(search_response['results'])} sources"]
+        "search_results": format_sources(found),
+        "sources": found,
+        "tokens_used": 0,
+        "search_calls": len(sub_queries) * (2 if escalate else 1),
+        "steps": [f"✓ Searched the web ({depth}) - Found {len(found)} sources"]
     }
 
-# Node 3: Synthesize with Search
-def synthesize_answer(state: ResearchState) -> ResearchState:
+# Node 5 (optional): Enrich Sources
+async def enrich_pages(state: ResearchState) -> ResearchState:
+    """Fetch full page text for the search results within a fixed time budget"""
+    sources, enriched = await get_page_fetcher().enrich_sources(state["sources"])
+    
+    return {
+        **state,
+        "sources": sources,
+        "search_results": format_sources(sources),
+        "tokens_used": 0,
+        "steps": [f"✓ Read {enriched} of {len(sources)} source pages in full"]
+    }
+
+# Node 6: Synthesize with Search
+async def synthesize_answer(state: ResearchState) -> ResearchState:
     """Create answer using search results"""
     llm = get_llm()
     query = state["query"]
@@ -88,16 +283,17 @@ Search Results:
 
 Provide a well-structured answer with citations where appropriate."""
     
-    response = llm.invoke(prompt)
+    response = await llm.ainvoke(with_context(state, prompt))
     
     return {
         **state,
         "final_answer": response.content,
+        "tokens_used": token_count(response),
         "steps": ["✓ Synthesized answer from search results"]
     }
 
-# Node 4: Direct Answer
-def direct_answer(state: ResearchState) -> ResearchState:
+# Node 7: Direct Answer
+async def direct_answer(state: ResearchState) -> ResearchState:
     """Answer directly without search"""
     llm = get_llm()
     query = state["query"]
@@ -108,14 +304,31 @@ Query: {query}
 
 Answer:"""
     
-    response = llm.invoke(prompt)
+    response = await llm.ainvoke(with_context(state, prompt))
     
     return {
         **state,
         "final_answer": response.content,
+        "tokens_used": token_count(response),
         "steps": ["✓ Generated answer from knowledge base"]
     }
 
+async def summarize_conversation(previous_summary: str, turns_text: str) -> str:
+    """Fold older conversation turns into the rolling summary (used by ConversationStore.fold)"""
+    llm = get_llm()
+    prompt = f"""Update the summary of a research conversation with the turns below.
+Keep the topics, entities and conclusions a follow-up question might refer to, in at most 150 words.
+
+Current summary: {previous_summary or "(none)"}
+
+Turns:
+{turns_text}
+
+Updated summary:"""
+    
+    response = await llm.ainvoke(prompt)
+    return response.content.strip()
+
 # Router Function
 def route_query(state: ResearchState) -> str:
     """Route to search or direct answer"""
@@ -125,12 +338,24 @@ def route_query(state: ResearchState) -> str:
         return "direct"
 
 # Build and return the compiled graph
-def create_graph():
-    """Create and compile the LangGraph workflow"""
+def create_graph(checkpointer=None, enrich_pages_enabled=ENRICH_PAGES):
+    """
+    Create and compile the LangGraph workflow
+    
+    Pass a checkpointer to persist state after every node, so a failed run
+    can be resumed from the last completed node instead of from scratch.
+    With enrich_pages_enabled (ENRICH_PAGES=1), full source pages are fetched
+    between searching and synthesizing.
+    """
+    # Imported here so importing this module stays cheap
+    from langgraph.graph import StateGraph, END
+    
     workflow = StateGraph(ResearchState)
     
     # Add nodes
     workflow.add_node("analyze", analyze_query)
+    workflow.add_node("plan", plan_search_step)
+    workflow.add_node("decompose", decompose_step)
     workflow.add_node("search", search_web)
     workflow.add_node("synthesize", synthesize_answer)
     workflow.add_node("direct", direct_answer)
@@ -143,16 +368,23 @@ def create_graph():
         "analyze",
         route_query,
         {
-            "search": "search",
+            "search": "plan",
             "direct": "direct"
         }
     )
     
     # Search path
-    workflow.add_edge("search", "synthesize")
+    workflow.add_edge("plan", "decompose")
+    workflow.add_edge("decompose", "search")
+    if enrich_pages_enabled:
+        workflow.add_node("enrich", enrich_pages)
+        workflow.add_edge("search", "enrich")
+        workflow.add_edge("enrich", "synthesize")
+    else:
+        workflow.add_edge("search", "synthesize")
     workflow.add_edge("synthesize", END)
     
     # Direct path
     workflow.add_edge("direct", END)
     
-    return workflow.compile()
\ No newline at end of file
+    return workflow.compile(checkpointer=checkpointer)
\ No newline at end of file
@@ -0,0 +1,190 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+# SQLite file shared by both Streamlit UIs
+HISTORY_DB = os.getenv("HISTORY_DB", "research_history.sqlite")
+
+# Items per sidebar page
+PAGE_SIZE = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    source TEXT NOT NULL,
+    query TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    needs_search INTEGER NOT NULL,
+    steps TEXT NOT NULL,
+    search_results TEXT NOT NULL
+);
+"""
+
+# Created after any migration, since older files lack the owner column
+INDEX_SCHEMA = """
+CREATE INDEX IF NOT EXISTS history_owner ON history (owner, id);
+"""
+
+# Full-text index over queries and answers, kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    query, answer, content='history', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts (rowid, query, answer) VALUES (new.id, new.query, new.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts (history_fts, rowid, query, answer)
+    VALUES ('delete', old.id, old.query, old.answer);
+END;
+"""
+
+# Columns needed to list history; full answers are only loaded for one item at a time
+SUMMARY_COLUMNS = (
+    "h.id, h.created_at, h.source, h.query, h.needs_search, "
+    "substr(h.answer, 1, 200) AS answer_preview"
+)
+
+
+OWNER_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def owner_id(candidate=None):
+    """`candidate` if it is a well-formed history owner id, else a new random one"""
+    if candidate and OWNER_PATTERN.fullmatch(candidate):
+        return candidate
+    return uuid.uuid4().hex
+
+
+def fts_query(text):
+    """Turn free text into a safe FTS5 query (all words, last one as a prefix)"""
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class HistoryStore:
+    """
+    Research history persisted in SQLite with an FTS5 index.
+
+    Listing and searching return only small summary rows one page at a
+    time, and full answers are read back for a single item on demand, so
+    a UI session's memory does not grow with the size of the history.
+
+    Every item belongs to an owner (a random id per browser session, see
+    owner_id()), and all reads and deletes are limited to one owner.
+    """
+
+    def __init__(self, path=HISTORY_DB):
+        self._lock = threading.Lock()
+        # Streamlit runs each session's script in its own thread
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(history)")]
+        if "owner" not in columns:
+            # Files from before history was per owner; their rows stay unowned
+            self.conn.execute("ALTER TABLE history ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        self.conn.executescript(INDEX_SCHEMA)
+        try:
+            self.conn.executescript(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: fall back to LIKE matching
+            self.has_fts = False
+        self.conn.commit()
+
+    def add(self, owner, query, answer, needs_search, steps=(), search_results="", source="streamlit"):
+        """Store a finished research result for an owner and return its id"""
+        with self._lock:
+            cursor = self.conn.execute(
+                """INSERT INTO history
+                   (owner, created_at, source, query, answer, needs_search, steps, search_results)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (owner, time.time(), source, query, answer, int(needs_search),
+                 json.dumps(list(steps)), search_results or ""),
+            )
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def get(self, owner, item_id):
+        """Full stored result for one of the owner's history items, or None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM history WHERE id = ? AND owner = ?", (item_id, owner)
+            ).fetchone()
+        if row is None:
+            return None
+        item = dict(row)
+        item["steps"] = json.loads(item["steps"])
+        item["needs_search"] = bool(item["needs_search"])
+        return item
+
+    def _where(self, owner, search):
+        if not search or not fts_query(search):
+            return "WHERE h.owner = ?", (owner,)
+        if self.has_fts:
+            return (
+                "WHERE h.owner = ? AND h.id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)",
+                (owner, fts_query(search)),
+            )
+        pattern = f"%{search}%"
+        return "WHERE h.owner = ? AND (h.query LIKE ? OR h.answer LIKE ?)", (owner, pattern, pattern)
+
+    def page(self, owner, page=0, page_size=PAGE_SIZE, search=None):
+        """One page of the owner's summary rows, newest first, optionally filtered by full-text search"""
+        where, params = self._where(owner, search)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM history h {where} "
+                "ORDER BY h.id DESC LIMIT ? OFFSET ?",
+                (*params, page_size, page * page_size),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, owner, search=None):
+        where, params = self._where(owner, search)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM history h {where}", params).fetchone()[0]
+
+    def method_counts(self, owner):
+        """(web searches, direct answers) across the owner's history"""
+        with self._lock:
+            searches, total = self.conn.execute(
+                "SELECT COALESCE(SUM(needs_search), 0), COUNT(*) FROM history WHERE owner = ?", (owner,)
+            ).fetchone()
+        return searches, total - searches
+
+    def top_queries(self, limit=10, since_s=7 * 24 * 3600, min_owners=2):
+        """
+        Most frequently asked queries over the last `since_s` seconds (for
+        prefetching). Counted across all owners, but only queries asked by
+        at least `min_owners` of them are returned, so one session's own
+        questions are never prefetched into the shared answer cache.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                """SELECT MIN(query) AS query, COUNT(*) AS n FROM history
+                   WHERE created_at >= ?
+                   GROUP BY lower(trim(query)) HAVING COUNT(DISTINCT owner) >= ?
+                   ORDER BY n DESC LIMIT ?""",
+                (time.time() - since_s, min_owners, limit),
+            ).fetchall()
+        return [row["query"] for row in rows]
+
+    def clear(self, owner):
+        """Delete the owner's history (and nobody else's)"""
+        with self._lock:
+            # The delete trigger keeps the full-text index in step
+            self.conn.execute("DELETE FROM history WHERE owner = ?", (owner,))
+            self.conn.commit()
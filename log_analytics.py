@@ -0,0 +1,241 @@
+"""
+Summarize the structured query log (see query_log.py) for capacity planning.
+
+Streams every record once, in constant memory: hot queries come from a
+space-saving top-k sketch, latency percentiles from fixed log-scale
+histograms, and provider cost is totalled per UTC day.
+
+    python log_analytics.py logs/
+    python log_analytics.py logs/queries-*.jsonl.gz --top 20 --json report.json
+
+Reports hot queries, the SEARCH/DIRECT mix, cache outcomes, latency
+percentiles overall and per graph node, and estimated cost per day.
+"""
+import argparse
+import glob
+import gzip
+import heapq
+import json
+import math
+import os
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+# Provider prices used for the cost estimate (override on the command line)
+USD_PER_MILLION_TOKENS = 0.70  # Groq llama-3.3-70b, blended input/output
+USD_PER_SEARCH = 0.008  # Tavily, one credit per basic search
+
+
+class SpaceSaving:
+    """
+    Approximate top-k counter (Metwally et al.) in O(capacity) memory.
+
+    A new key that finds the table full replaces the current minimum and
+    inherits its count, so counts are overestimated by at most `error`.
+    The minimum is found with a lazily updated heap that is rebuilt
+    whenever it holds too many stale entries.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.labels = {}
+        self.heap = []
+
+    def _push(self, key):
+        heapq.heappush(self.heap, (self.counts[key], key))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(count, k) for k, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def _pop_min(self):
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count:
+                return key
+
+    def add(self, key, label=None):
+        if key in self.counts:
+            self.counts[key] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = 1
+            self.errors[key] = 0
+        else:
+            victim = self._pop_min()
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim)
+            self.labels.pop(victim, None)
+            self.counts[key] = floor + 1
+            self.errors[key] = floor
+        if label and key not in self.labels:
+            self.labels[key] = label
+        self._push(key)
+
+    def top(self, k):
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(key, count, self.errors[key], self.labels.get(key)) for key, count in ranked]
+
+
+class LogHistogram:
+    """Latency histogram with log-spaced buckets (about 5% relative error), any number of samples"""
+
+    GROWTH = 1.05
+    MIN_MS = 0.1
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        bucket = 0 if ms <= self.MIN_MS else int(math.log(ms / self.MIN_MS, self.GROWTH)) + 1
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # Upper edge of the bucket, capped at the largest value seen
+                return min(self.MIN_MS * self.GROWTH ** bucket, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 1) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 1),
+            "p90_ms": round(self.percentile(90), 1),
+            "p99_ms": round(self.percentile(99), 1),
+            "max_ms": round(self.max, 1),
+        }
+
+
+def log_files(paths):
+    """Expand directories and globs into log files, oldest first"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += glob.glob(os.path.join(path, "queries-*.jsonl*"))
+        else:
+            files += glob.glob(path) or [path]
+    return sorted(set(files), key=os.path.getmtime)
+
+
+def read_records(files):
+    for path in files:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A worker killed mid-write can leave a truncated last line
+                    continue
+
+
+def analyze(records, top_capacity, usd_per_mtok, usd_per_search):
+    hot = SpaceSaving(top_capacity)
+    routes = Counter()
+    cache = Counter()
+    statuses = Counter()
+    latency = LogHistogram()
+    node_latency = defaultdict(LogHistogram)
+    days = defaultdict(lambda: {"requests": 0, "tokens": 0, "searches": 0})
+    total = 0
+
+    for record in records:
+        total += 1
+        statuses[record.get("status", 0)] += 1
+        if record.get("query_hash"):
+            hot.add(record["query_hash"], record.get("query"))
+        if record.get("route"):
+            routes[record["route"]] += 1
+        if record.get("cache"):
+            cache[record["cache"]] += 1
+        if "latency_ms" in record:
+            latency.add(record["latency_ms"])
+        for node, ms in (record.get("node_ms") or {}).items():
+            node_latency[node].add(ms)
+        day = datetime.fromtimestamp(record.get("ts", 0), timezone.utc).strftime("%Y-%m-%d")
+        days[day]["requests"] += 1
+        days[day]["tokens"] += record.get("tokens", 0)
+        days[day]["searches"] += record.get("search_calls", 0)
+
+    for usage in days.values():
+        usage["cost_usd"] = round(
+            usage["tokens"] / 1e6 * usd_per_mtok + usage["searches"] * usd_per_search, 2
+        )
+    return {
+        "records": total,
+        "statuses": dict(statuses),
+        "routes": dict(routes),
+        "cache": dict(cache),
+        "latency": latency.summary(),
+        "node_latency": {node: hist.summary() for node, hist in sorted(node_latency.items())},
+        "days": dict(sorted(days.items())),
+        "hot_queries": hot,
+    }
+
+
+def print_report(report, top):
+    total = report["records"]
+    print(f"Records: {total}")
+    print(f"Statuses: {report['statuses']}")
+
+    routed = sum(report["routes"].values())
+    if routed:
+        mix = ", ".join(f"{route.upper()} {n / routed:.1%}" for route, n in sorted(report["routes"].items()))
+        print(f"Route mix: {mix}")
+    if report["cache"]:
+        print("Cache: " + ", ".join(f"{outcome} {n / total:.1%}" for outcome, n in report["cache"].items()))
+
+    print("\nLatency (ms)      count     p50     p90     p99     max")
+    rows = [("total", report["latency"])] + list(report["node_latency"].items())
+    for name, s in rows:
+        print(f"  {name:<12} {s['count']:>8} {s['p50_ms']:>7} {s['p90_ms']:>7} {s['p99_ms']:>7} {s['max_ms']:>7}")
+
+    print(f"\nHot queries (top {top}; count may be over by at most 'err')")
+    for key, count, error, label in report["hot_queries"].top(top):
+        print(f"  {count:>7}  err {error:<5} {label or key}")
+
+    print("\nDay          requests      tokens  searches   est. cost")
+    for day, usage in report["days"].items():
+        print(f"  {day}  {usage['requests']:>8} {usage['tokens']:>11} {usage['searches']:>9}   ${usage['cost_usd']:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("paths", nargs="*", default=["logs"], help="log files, globs or directories")
+    parser.add_argument("--top", type=int, default=10, help="hot queries to show")
+    parser.add_argument("--capacity", type=int, default=1000, help="counters kept by the top-k sketch")
+    parser.add_argument("--usd-per-mtok", type=float, default=USD_PER_MILLION_TOKENS)
+    parser.add_argument("--usd-per-search", type=float, default=USD_PER_SEARCH)
+    parser.add_argument("--json", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    files = log_files(args.paths)
+    if not files:
+        sys.exit(f"No query logs found in {' '.join(args.paths)}")
+    report = analyze(read_records(files), max(args.capacity, args.top), args.usd_per_mtok, args.usd_per_search)
+    print_report(report, args.top)
+
+    if args.json:
+        hot = [
+            {"query_hash": key, "query": label, "count": count, "max_overcount": error}
+            for key, count, error, label in report["hot_queries"].top(args.top)
+        ]
+        with open(args.json, "w") as f:
+            json.dump({**report, "hot_queries": hot}, f, indent=2)
@@ -4,16 +4,19 @@ from typing import TypedDict, Annotated
 import operator
 from dotenv import load_dotenv
 import time
+import math
 from datetime import datetime
 
-# LangGraph & LangChain imports - Compatible with v0.2+
-from langgraph.graph import StateGraph, END, START
-from langchain_groq import ChatGroq
-from tavily import TavilyClient
-
-# Load environment variables
+# Load environment variables before the project modules below read their settings
 load_dotenv()
 
+from history_store import HistoryStore, PAGE_SIZE, owner_id
+
+# LangGraph, LangChain and Tavily are imported inside the functions that use
+# them, so a fresh session can render the page before they are loaded.
+
+from search_planning import plan_search, remaining_budget, results_are_thin, log_outcome
+
 # --- 1. PAGE CONFIGURATION ---
 st.set_page_config(
     page_title="AI Research Assistant",
@@ -23,8 +26,22 @@ st.set_page_config(
 )
 
 # --- 2. INITIALIZE SESSION STATE ---
-if 'search_history' not in st.session_state:
-    st.session_state.search_history = []
+@st.cache_resource
+def get_history_store():
+    """Persistent research history (same file as frontend.py); each session reads only its own items"""
+    return HistoryStore()
+
+history = get_history_store()
+
+# Each browser session sees only its own history. The owner id lives in the
+# URL, so a reload or a bookmark returns to the same history.
+history_owner = owner_id(st.query_params.get("history"))
+if st.query_params.get("history") != history_owner:
+    st.query_params["history"] = history_owner
+
+# Only small values live in the session; history itself stays in SQLite
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
 
 # --- 3. CUSTOM CSS FOR PROFESSIONAL ANIMATIONS ---
 st.markdown("""
@@ -163,7 +180,9 @@ with st.sidebar:
     
     # Delete history button
     if st.button("🔥 Delete History", use_container_width=True):
-        st.session_state.search_history = []
+        history.clear(history_owner)
+        st.session_state.history_page = 0
+        st.session_state.replay_id = None
         st.success("✅ History deleted!")
         time.sleep(1)
         st.rerun()
@@ -173,16 +192,49 @@ with st.sidebar:
     # Search History Section
     st.markdown("### 📚 Search History")
     
-    if st.session_state.search_history:
-        st.markdown(f"**Total Searches:** {len(st.session_state.search_history)}")
+    history_search = st.text_input(
+        "Search history",
+        placeholder="Words from past questions or answers",
+        key="history_search"
+    )
+    total = history.count(history_owner, history_search)
+    
+    if total:
+        st.markdown(f"**Total Searches:** {total}")
+        
+        pages = math.ceil(total / PAGE_SIZE)
+        page = min(st.session_state.history_page, pages - 1)
         
-        for idx, item in enumerate(reversed(st.session_state.search_history[-10:])):
+        for item in history.page(history_owner, page, search=history_search):
             with st.expander(f"🔍 {item['query'][:40]}...", expanded=False):
-                st.markdown(f"**Time:** {item['timestamp']}")
-                st.markdown(f"**Method:** {item['method']}")
-                if st.button(f"Rerun", key=f"rerun_{idx}"):
-                    st.session_state.selected_query = item['query']
+                st.markdown(f"**Time:** {datetime.fromtimestamp(item['created_at']).strftime('%Y-%m-%d %H:%M:%S')}")
+                st.markdown(f"**Method:** {'Web Search' if item['needs_search'] else 'Direct Answer'}")
+                show_col, rerun_col = st.columns(2)
+                with show_col:
+                    # Serve the stored answer instantly - no API calls
+                    if st.button("Show", key=f"show_{item['id']}"):
+                        st.session_state.replay_id = item['id']
+                        st.rerun()
+                with rerun_col:
+                    if st.button("Re-research", key=f"rerun_{item['id']}"):
+                        st.session_state.selected_query = item['query']
+                        st.session_state.force_query = item['query']
+                        st.rerun()
+        
+        if pages > 1:
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            with prev_col:
+                if st.button("◀", disabled=page == 0, key="history_prev"):
+                    st.session_state.history_page = page - 1
                     st.rerun()
+            with page_col:
+                st.caption(f"Page {page + 1} of {pages}")
+            with next_col:
+                if st.button("▶", disabled=page >= pages - 1, key="history_next"):
+                    st.session_state.history_page = page + 1
+                    st.rerun()
+    elif history_search:
+        st.info("No history matches your search.")
     else:
         st.info("No search history yet. Start researching!")
     
@@ -190,10 +242,8 @@ with st.sidebar:
     
     # Statistics
     st.markdown("### 📊 Statistics")
-    if st.session_state.search_history:
-        search_count = sum(1 for item in st.session_state.search_history if item['method'] == 'Web Search')
-        direct_count = len(st.session_state.search_history) - search_count
-        
+    search_count, direct_count = history.method_counts(history_owner)
+    if search_count or direct_count:
         col1, col2 = st.columns(2)
         with col1:
             st.metric("🌐 Searches", search_count)
@@ -244,8 +294,21 @@ def load_api_keys():
     
     return groq_key, tavily_key, langchain_key
 
+def is_rejected_key(error):
+    """True if the provider rejected the key itself, rather than failing transiently"""
+    return (
+        getattr(error, "status_code", None) in (401, 403)
+        or type(error).__name__ in ("AuthenticationError", "PermissionDeniedError", "InvalidAPIKeyError")
+    )
+
+# Verification makes a real API call, so cache the result instead of
+# repeating it on every Streamlit rerun. Only verdicts are cached: network
+# errors are raised (st.cache_data doesn't cache exceptions) and retried
+# on the next rerun.
+@st.cache_data(ttl=3600, show_spinner=False)
 def verify_groq_key(api_key):
     """Test if Groq API key is valid"""
+    from langchain_groq import ChatGroq
     try:
         test_llm = ChatGroq(
             model="llama-3.3-70b-versatile", 
@@ -254,17 +317,23 @@ def verify_groq_key(api_key):
         )
         test_llm.invoke("test")
         return True
-    except Exception:
-        return False
+    except Exception as e:
+        if is_rejected_key(e):
+            return False
+        raise
 
+@st.cache_data(ttl=3600, show_spinner=False)
 def verify_tavily_key(api_key):
     """Test if Tavily API key is valid"""
+    from tavily import TavilyClient
     try:
         test_client = TavilyClient(api_key=api_key)
         test_client.search(query="test", max_results=1)
         return True
-    except Exception:
-        return False
+    except Exception as e:
+        if is_rejected_key(e):
+            return False
+        raise
 
 # Load and verify API keys
 groq_key, tavily_key, langchain_key = load_api_keys()
@@ -274,11 +343,17 @@ tavily_valid = False
 
 if groq_key:
     with st.spinner("Verifying Groq API key..."):
-        groq_valid = verify_groq_key(groq_key)
+        try:
+            groq_valid = verify_groq_key(groq_key)
+        except Exception:
+            groq_valid = False
 
 if tavily_key:
     with st.spinner("Verifying Tavily API key..."):
-        tavily_valid = verify_tavily_key(tavily_key)
+        try:
+            tavily_valid = verify_tavily_key(tavily_key)
+        except Exception:
+            tavily_valid = False
 
 # Display configuration status
 col1, col2, col3 = st.columns(3)
@@ -358,10 +433,14 @@ class ResearchState(TypedDict):
     search_results: str
     final_answer: str
     steps: Annotated[list[str], operator.add]
+    started_at: float
 
 @st.cache_resource
 def get_graph(_groq_api_key, _tavily_api_key):
     """Build and compile the research graph"""
+    from langgraph.graph import StateGraph, END, START
+    from langchain_groq import ChatGroq
+    from tavily import TavilyClient
     
     # Initialize LLM and search client
     llm = ChatGroq(
@@ -391,22 +470,39 @@ Respond with ONLY one word: "SEARCH" or "DIRECT"
 
     # Node 2: Search the web
     def search_web(state: ResearchState):
-        """Search the web using Tavily API"""
+        """Search the web using Tavily API, picking depth and result count per query"""
         try:
-            search_response = tavily_client.search(
+            plan = plan_search(state["query"], remaining_budget(state["started_at"]))
+            depth = plan["search_depth"]
+            
+            start = time.perf_counter()
+            found = tavily_client.search(
                 query=state["query"], 
-                max_results=3,
-                search_depth="advanced"
-            )
+                max_results=plan["max_results"],
+                search_depth=depth
+            ).get('results', [])
+            escalate = plan["allow_escalation"] and results_are_thin(found)
+            log_outcome(state["query"], plan, depth, found, time.perf_counter() - start, escalated=escalate)
+            
+            # Only pay for an advanced search when the basic one came back thin
+            if escalate:
+                depth = "advanced"
+                start = time.perf_counter()
+                found = tavily_client.search(
+                    query=state["query"], 
+                    max_results=plan["max_results"],
+                    search_depth=depth
+                ).get('results', [])
+                log_outcome(state["query"], plan, depth, found, time.perf_counter() - start, escalated=True)
             
             results = "\n\n".join([
                 f"📄 Source: {r['url']}\n{r['content']}" 
-                for r in search_response.get('results', [])
+                for r in found
             ])
             
             return {
                 "search_results": results, 
-                "steps": [f"🌐 Retrieved {len(search_response.get('results', []))} sources from Tavily"]
+                "steps": [f"🌐 Retrieved {len(found)} sources from Tavily ({depth} search)"]
             }
         except Exception as e:
             return {
@@ -489,6 +585,25 @@ Be concise but comprehensive.
     return workflow.compile()
 
 # --- 8. USER INTERFACE ---
+def render_result(result, animate=True):
+    """Show pipeline steps, the answer and source data for a research result"""
+    st.markdown("### 🔄 Research Pipeline")
+    
+    for step in result["steps"]:
+        if animate:
+            time.sleep(0.2)  # Slight delay for visual effect
+        st.markdown(f'<div class="step-card">{step}</div>', unsafe_allow_html=True)
+    
+    # Display results
+    st.markdown("---")
+    st.markdown("### 📝 Research Results")
+    st.markdown(result["final_answer"])
+    
+    # Show source data if search was performed
+    if result["search_results"] and "Search error" not in result["search_results"]:
+        with st.expander("📚 View Source Data"):
+            st.text(result["search_results"])
+
 query = st.text_input(
     "🔎 What would you like to research?",
     value=st.session_state.get('selected_query', ''),
@@ -504,8 +619,15 @@ col1, col2, col3 = st.columns([1, 2, 1])
 with col2:
     run_button = st.button("🚀 Start Research", use_container_width=True)
 
+# "Re-research" in the history sidebar runs the pipeline again on request
+forced_query = st.session_state.pop('force_query', None)
+if forced_query:
+    query = forced_query
+    run_button = True
+
 # Execute research when button is clicked
 if run_button and query:
+    st.session_state.replay_id = None
     try:
         # Get the compiled graph
         app = get_graph(groq_key, tavily_key)
@@ -519,37 +641,26 @@ if run_button and query:
             "needs_search": False,
             "search_results": "",
             "final_answer": "",
-            "steps": []
+            "steps": [],
+            "started_at": time.time()
         }
         
         # Execute the workflow
         with st.spinner("🤖 AI agents analyzing your query..."):
             result = app.invoke(initial_input)
         
-        # Display pipeline steps
-        st.markdown("### 🔄 Research Pipeline")
-        
-        for step in result["steps"]:
-            time.sleep(0.2)  # Slight delay for visual effect
-            st.markdown(f'<div class="step-card">{step}</div>', unsafe_allow_html=True)
+        render_result(result)
         
         # Add to search history
-        method = "Web Search" if result["needs_search"] else "Direct Answer"
-        st.session_state.search_history.append({
-            "query": query,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "method": method
-        })
-        
-        # Display results
-        st.markdown("---")
-        st.markdown("### 📝 Research Results")
-        st.markdown(result["final_answer"])
-        
-        # Show source data if search was performed
-        if result["search_results"] and "Search error" not in result["search_results"]:
-            with st.expander("📚 View Source Data"):
-                st.text(result["search_results"])
+        history.add(
+            history_owner,
+            query,
+            result["final_answer"],
+            result["needs_search"],
+            result["steps"],
+            result["search_results"],
+            source="streamlit"
+        )
         
         # Success message
         st.success("✅ Research completed successfully!")
@@ -571,6 +682,23 @@ if run_button and query:
 elif run_button and not query:
     st.warning("⚠️ Please enter a research query to begin.")
 
+# Show a stored result picked from the history sidebar
+elif st.session_state.get('replay_id'):
+    item = history.get(history_owner, st.session_state.replay_id)
+    if item:
+        researched_at = datetime.fromtimestamp(item["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        st.info(f"⚡ **{item['query']}** - served from history (researched {researched_at})")
+        render_result({
+            "steps": item["steps"],
+            "final_answer": item["answer"],
+            "search_results": item["search_results"]
+        }, animate=False)
+        if st.button("🔄 Re-research with fresh results"):
+            st.session_state.selected_query = item["query"]
+            st.session_state.force_query = item["query"]
+            st.session_state.replay_id = None
+            st.rerun()
+
 # --- 9. FOOTER ---
 st.markdown("---")
 st.markdown("""
@@ -0,0 +1,391 @@
+import asyncio
+import contextlib
+import functools
+import hashlib
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+# Turn the enrichment stage on with ENRICH_PAGES=1
+ENRICH_PAGES = os.getenv("ENRICH_PAGES", "").lower() in ("1", "true", "yes")
+
+# On-disk cache of extracted page text; entries unused for PAGE_CACHE_MAX_AGE_DAYS are deleted
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", ".page_cache")
+PAGE_CACHE_MAX_AGE_S = float(os.getenv("PAGE_CACHE_MAX_AGE_DAYS", "7")) * 86400
+
+# How often the fetcher prunes the cache (seconds)
+PAGE_CACHE_PRUNE_INTERVAL_S = 3600
+
+# Time budgets (seconds): per page, and for the whole enrichment stage
+PAGE_TIMEOUT_S = float(os.getenv("PAGE_TIMEOUT_S", "3"))
+ENRICH_BUDGET_S = float(os.getenv("ENRICH_BUDGET_S", "5"))
+
+# Cached pages younger than this are used without revalidating
+PAGE_FRESH_S = 3600
+
+# Connection limits for the shared client
+MAX_CONNECTIONS = 20
+PER_HOST_LIMIT = 2
+
+# Longest page text handed to the LLM per source
+MAX_PAGE_CHARS = 4000
+
+# Bytes of a page body read at most (the rest is never downloaded) and
+# redirects followed per page
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# Content types worth extracting text from
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+
+# Extracted blocks shorter than this many words are treated as boilerplate
+MIN_BLOCK_WORDS = 8
+
+USER_AGENT = "ai-research-assistant/1.0 (+page enrichment)"
+
+
+class BlockedDestination(Exception):
+    """A page URL points at a scheme or address the fetcher may not reach"""
+
+
+def blocked_address(address):
+    """True for loopback, private, link-local (cloud metadata) and other non-public addresses"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return not ip.is_global or ip.is_multicast
+
+
+async def read_limited(response, limit):
+    """Body of a streamed response, stopping after `limit` bytes"""
+    chunks = []
+    size = 0
+    async for chunk in response.aiter_bytes():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return b"".join(chunks)[:limit]
+
+
+def decode_body(body, charset):
+    try:
+        return body.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+class TextExtractor(HTMLParser):
+    """Collect paragraph-like text blocks, skipping navigation and scripts"""
+
+    SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg"}
+    BLOCK_TAGS = {"p", "li", "h1", "h2", "h3", "h4", "blockquote", "pre", "td", "article", "section", "div"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.blocks = []
+        self.current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.current.append(data)
+
+    def flush(self):
+        text = " ".join("".join(self.current).split())
+        self.current = []
+        if len(text.split()) >= MIN_BLOCK_WORDS:
+            self.blocks.append(text)
+
+
+@functools.cache
+def load_trafilatura():
+    """trafilatura if installed (optional and slow to import, so loaded on first use)"""
+    try:
+        import trafilatura
+    except ImportError:  # fall back to the built-in extractor below
+        return None
+    return trafilatura
+
+
+def extract_main_text(html):
+    """Main readable text of an HTML page, without menus, footers and scripts"""
+    trafilatura = load_trafilatura()
+    if trafilatura is not None:
+        text = trafilatura.extract(html, include_comments=False, include_tables=False)
+        if text:
+            return text
+    extractor = TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    extractor.flush()
+    return "\n\n".join(extractor.blocks)
+
+
+class PageCache:
+    """
+    Content-addressed cache of extracted page text.
+
+    Extracted text is stored once under the SHA-256 of its content in
+    blobs/, and each URL has a small index entry in urls/ pointing at its
+    blob along with the ETag / Last-Modified validators for revalidation.
+    Identical pages reached through different URLs share one blob.
+    Entries and blobs not used for PAGE_CACHE_MAX_AGE_S are removed by
+    prune().
+    """
+
+    def __init__(self, root=PAGE_CACHE_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, "urls"), exist_ok=True)
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+
+    def _entry_path(self, url):
+        return os.path.join(self.root, "urls", hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest + ".txt")
+
+    def lookup(self, url):
+        """Index entry for a URL, or None if it is not cached"""
+        try:
+            with open(self._entry_path(url)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if os.path.exists(self._blob_path(entry["digest"])) else None
+
+    def read(self, entry):
+        with open(self._blob_path(entry["digest"]), encoding="utf-8") as f:
+            return f.read()
+
+    def store(self, url, text, etag=None, last_modified=None):
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        blob = self._blob_path(digest)
+        if not os.path.exists(blob):
+            self._write_atomic(blob, text)
+        self.touch(url, {"digest": digest, "etag": etag, "last_modified": last_modified})
+
+    def touch(self, url, entry):
+        """Mark an entry (and the blob it points at) as revalidated now"""
+        entry = {**entry, "url": url, "checked_at": time.time()}
+        self._write_atomic(self._entry_path(url), json.dumps(entry))
+        with contextlib.suppress(OSError):
+            os.utime(self._blob_path(entry["digest"]))
+
+    def prune(self, max_age_s=PAGE_CACHE_MAX_AGE_S):
+        """Delete entries and blobs not written or revalidated for max_age_s; returns files removed"""
+        cutoff = time.time() - max_age_s
+        removed = 0
+        for folder in ("urls", "blobs"):
+            for entry in os.scandir(os.path.join(self.root, folder)):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
+
+    def _write_atomic(self, path, text):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+class PageFetcher:
+    """
+    Connection-pooled async page fetcher with a per-host concurrency limit.
+
+    Page URLs come from search results, so every hop (the URL and each
+    redirect, followed here rather than by httpx) is resolved and refused
+    if it points at a loopback, private or link-local address, unless
+    allow_private is set (e.g. for a local test server). Only HTML is read,
+    and at most MAX_PAGE_BYTES of it.
+    """
+
+    def __init__(self, client=None, cache=None, allow_private=False):
+        import httpx
+
+        self.client = client or httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(PAGE_TIMEOUT_S),
+            follow_redirects=False,
+            headers={"User-Agent": USER_AGENT},
+        )
+        self.cache = cache or PageCache()
+        self.allow_private = allow_private
+        # host -> [semaphore, requests using it]; hosts leave once idle
+        self.host_limits = {}
+        self.pruned_at = time.monotonic()
+        self.prune_task = None
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    @contextlib.asynccontextmanager
+    async def host_slot(self, url):
+        """Limit concurrent requests to one host"""
+        host = urlsplit(url).netloc.lower()
+        limit = self.host_limits.setdefault(host, [asyncio.Semaphore(PER_HOST_LIMIT), 0])
+        limit[1] += 1
+        try:
+            async with limit[0]:
+                yield
+        finally:
+            limit[1] -= 1
+            if not limit[1]:
+                del self.host_limits[host]
+
+    async def check_destination(self, url):
+        """Raise BlockedDestination unless the URL is http(s) to public addresses only"""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise BlockedDestination(f"Not an http(s) URL: {url}")
+        if self.allow_private:
+            return
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise BlockedDestination(f"Cannot resolve {parts.hostname}") from e
+        if any(blocked_address(info[4][0]) for info in infos):
+            raise BlockedDestination(f"{parts.hostname} resolves to a non-public address")
+
+    async def get(self, url, headers):
+        """
+        GET a page, checking the destination of every redirect hop.
+
+        Returns (status, response headers, body); the body is None for
+        non-HTML responses and empty for 304.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            await self.check_destination(url)
+            async with self.host_slot(url), self.client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304:
+                    return 304, response.headers, b""
+                if response.status_code in REDIRECT_CODES and "location" in response.headers:
+                    url = urljoin(url, response.headers["location"])
+                    continue
+                response.raise_for_status()
+                content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                if content_type not in HTML_TYPES:
+                    return response.status_code, response.headers, None
+                body = decode_body(await read_limited(response, MAX_PAGE_BYTES), response.charset_encoding)
+                return response.status_code, response.headers, body
+        raise BlockedDestination(f"More than {MAX_REDIRECTS} redirects: {url}")
+
+    def maybe_prune(self):
+        """Prune the page cache in the background at most every PAGE_CACHE_PRUNE_INTERVAL_S"""
+        if time.monotonic() - self.pruned_at < PAGE_CACHE_PRUNE_INTERVAL_S:
+            return
+        if self.prune_task is not None and not self.prune_task.done():
+            return
+        self.pruned_at = time.monotonic()
+        self.prune_task = asyncio.create_task(asyncio.to_thread(self.cache.prune))
+
+    async def fetch_page_text(self, url):
+        """
+        Extracted main text of a page, using the cache where possible.
+
+        Fresh cache entries are returned without touching the network; older
+        ones are revalidated with If-None-Match / If-Modified-Since so an
+        unchanged page costs a 304 instead of a download and re-extraction.
+        """
+        entry = await asyncio.to_thread(self.cache.lookup, url)
+        if entry and time.time() - entry["checked_at"] < PAGE_FRESH_S:
+            return await asyncio.to_thread(self.cache.read, entry)
+
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        status, response_headers, body = await asyncio.wait_for(self.get(url, headers), PAGE_TIMEOUT_S)
+
+        if status == 304 and entry:
+            await asyncio.to_thread(self.cache.touch, url, entry)
+            return await asyncio.to_thread(self.cache.read, entry)
+        if not body:
+            return ""
+
+        # Extraction is CPU-bound; keep it off the event loop
+        text = await asyncio.to_thread(extract_main_text, body)
+        await asyncio.to_thread(
+            self.cache.store,
+            url,
+            text,
+            response_headers.get("etag"),
+            response_headers.get("last-modified"),
+        )
+        return text
+
+    async def enrich_sources(self, sources, budget_s=ENRICH_BUDGET_S):
+        """
+        Add full page text to search results, fetching all pages concurrently.
+
+        Returns copies of the sources where each one whose page was fetched
+        within the budget has a "page_text" key; pages that fail or run past
+        the total budget keep just their search snippet. Also returns the
+        number of pages enriched.
+        """
+        self.maybe_prune()
+        sources = [dict(source) for source in sources]
+        tasks = {
+            asyncio.create_task(self.fetch_page_text(source["url"])): source
+            for source in sources if source.get("url")
+        }
+        if not tasks:
+            return sources, 0
+
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=budget_s)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        for task in pending:
+            task.cancel()
+
+        enriched = 0
+        for task in done:
+            if task.exception() is not None:
+                continue
+            text = task.result()
+            if text:
+                tasks[task]["page_text"] = text[:MAX_PAGE_CHARS]
+                enriched += 1
+        return sources, enriched
+
+
+_fetcher = None
+
+
+def get_page_fetcher():
+    """Process-wide fetcher so connections are pooled across requests"""
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = PageFetcher()
+    return _fetcher
@@ -0,0 +1,203 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Debug endpoints (CPU profile, tracemalloc) are only mounted when this is set
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+
+# Time between stack samples; 10 ms keeps the overhead around 1% of one core
+PROFILE_INTERVAL_S = float(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000
+MAX_PROFILE_SECONDS = 60
+
+# Leaf frames (file, function) of threads that are blocked rather than running:
+# idle pool workers, the event loop waiting in select(), queue consumers...
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("socket.py", "accept"),
+    # uvloop (which serve.py uses when installed) waits for events in C, so
+    # an idle loop thread's innermost Python frame is the call that runs it
+    ("runners.py", "run"),
+    ("base_events.py", "run_forever"),
+    ("base_events.py", "run_until_complete"),
+    ("base_events.py", "_run_once"),
+}
+
+# Frames kept per allocation traceback while tracemalloc is tracing
+TRACEMALLOC_FRAMES = 10
+
+# Memory snapshots kept for diffing
+MAX_SNAPSHOTS = 8
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already being taken in this worker"""
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def is_idle(frame):
+    """True if a thread's innermost Python frame is a known blocking wait"""
+    code = frame.f_code
+    if f"{os.sep}uvloop{os.sep}" in code.co_filename:
+        # uvloop.run() and friends: everything below them is the C event loop
+        return True
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+def collapse_stack(frame):
+    """A frame's stack as "root;...;leaf", the collapsed format flamegraph.pl reads"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Sampling CPU profiler for a live worker.
+
+    A background thread reads every thread's current stack with
+    sys._current_frames() at a fixed interval and counts identical stacks.
+    Threads blocked in a known wait (see IDLE_FRAMES) are left out, so the
+    result approximates where CPU time goes rather than wall-clock time;
+    pass include_idle=True for a wall-clock profile. Under uvloop the loop
+    waits in C, so an idle loop is recognized by having no Python frame
+    above the call that runs it; time the loop itself spends in C (parsing,
+    I/O callbacks) is dropped along with its idle time. Nothing is hooked into
+    the interpreter, so the profiled code runs at full speed apart from the
+    sampler's own wakeups, and nothing runs at all between profiles.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_S):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def run(self, seconds, include_idle=False):
+        """Sample for `seconds` and return (collapsed stacks text, samples taken)"""
+        if not seconds > 0:
+            raise ValueError("seconds must be positive")
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A CPU profile is already running")
+        try:
+            return self._sample(min(seconds, MAX_PROFILE_SECONDS), include_idle)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds, include_idle):
+        me = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (not include_idle and is_idle(frame)):
+                    continue
+                stacks[f"{names.get(ident, ident)};{collapse_stack(frame)}"] += 1
+            samples += 1
+            time.sleep(self.interval)
+        lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+        return "\n".join(lines) + "\n", samples
+
+
+class MemoryTracer:
+    """
+    tracemalloc snapshots and diffs for finding allocation growth.
+
+    Tracing only runs between start() and stop(), so there is no overhead
+    otherwise. Each snapshot records how many graph runs had completed, so
+    a diff can be read as growth per run.
+    """
+
+    def __init__(self, max_snapshots=MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self.snapshots = {}
+        self.next_id = 1
+        self._lock = threading.Lock()
+
+    def start(self, frames=TRACEMALLOC_FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return self.status()
+
+    def stop(self):
+        tracemalloc.stop()
+        with self._lock:
+            self.snapshots.clear()
+        return self.status()
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        with self._lock:
+            snapshots = [
+                {"id": snapshot_id, "taken_at": taken_at, "completed_runs": runs}
+                for snapshot_id, (_, taken_at, runs) in self.snapshots.items()
+            ]
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "snapshots": snapshots,
+        }
+
+    def snapshot(self, completed_runs, limit=20):
+        """Take a snapshot and return its id and the top allocation sites"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running; start it first")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        with self._lock:
+            snapshot_id = self.next_id
+            self.next_id += 1
+            self.snapshots[snapshot_id] = (snapshot, time.time(), completed_runs)
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.pop(min(self.snapshots))
+        top = [
+            {"site": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
+        return {"id": snapshot_id, "completed_runs": completed_runs, "top": top}
+
+    def diff(self, base_id, target_id, limit=20, group_by="lineno"):
+        """Allocation growth by site between two snapshots, largest first"""
+        with self._lock:
+            base = self.snapshots.get(base_id)
+            target = self.snapshots.get(target_id)
+        if base is None or target is None:
+            raise KeyError("Unknown snapshot id")
+        runs = max(target[2] - base[2], 0)
+        stats = target[0].compare_to(base[0], group_by)[:limit]
+        return {
+            "base": base_id,
+            "target": target_id,
+            "runs_between": runs,
+            "total_growth_bytes": sum(stat.size_diff for stat in target[0].compare_to(base[0], "filename")),
+            "sites": [
+                {
+                    "site": [str(frame) for frame in stat.traceback] if group_by == "traceback" else str(stat.traceback[0]),
+                    "size_diff_bytes": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "size_bytes": stat.size,
+                    "bytes_per_run": round(stat.size_diff / runs, 1) if runs else None,
+                }
+                for stat in stats
+            ],
+        }
+
+
+profiler = SamplingProfiler()
+memory = MemoryTracer()
@@ -0,0 +1,158 @@
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Never fan a query out into more searches than this (including the original)
+MAX_SUB_QUERIES = 5
+
+# Keep at most this many sources after merging sub-query results
+MAX_MERGED_RESULTS = 10
+
+# "compare X and Y on A and B", "X vs Y for A", "difference between X and Y in A"
+COMPARE_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:compare|comparison of|contrast)\s+(?P<items>.+?)"
+    r"(?:\s+(?:on|in terms of|for|regarding|across|by)\s+(?P<aspects>.+))?$",
+    re.IGNORECASE,
+)
+DIFFERENCE_PATTERN = re.compile(
+    r"^(?:what(?:'s| is| are)\s+)?(?:the\s+)?differences?\s+between\s+(?P<items>.+?)"
+    r"(?:\s+(?:on|in terms of|for|regarding|across|in)\s+(?P<aspects>.+))?$",
+    re.IGNORECASE,
+)
+VERSUS_PATTERN = re.compile(r"\s+(?:vs\.?|versus)\s+", re.IGNORECASE)
+LIST_SPLIT = re.compile(r"\s*(?:,\s*(?:and\s+)?|\s+and\s+|\s+&\s+)\s*", re.IGNORECASE)
+
+# Parts that are not a subject of their own, so splitting on "and" cut a
+# phrase apart ("the pros and cons of X" -> "the pros", "cons of X")
+FRAGMENT_PATTERN = re.compile(
+    r"^(?:the|a|an|its|their|of|to|with)\b|"
+    r"\b(?:pros|cons|advantages|disadvantages|benefits|drawbacks|differences|similarities)\b",
+    re.IGNORECASE,
+)
+
+# A sub-query needs this many content words to be worth a search of its own
+# ("Is it true? yes" would otherwise search for "yes")
+MIN_CONTENT_WORDS = 2
+FUNCTION_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "do", "does", "did", "it", "its", "this", "that",
+    "what", "which", "who", "how", "why", "when", "where", "can", "could", "should", "would", "will",
+    "of", "in", "on", "for", "to", "and", "or", "with", "vs", "versus", "yes", "no", "ok", "so",
+    "i", "you", "we", "they", "he", "she", "me", "my", "your", "there", "about", "any",
+}
+WORD_PATTERN = re.compile(r"[\w+#.-]+")
+
+# Query-string parameters that don't change which page a URL points at
+TRACKING_PARAMS = {"ref", "ref_src", "fbclid", "gclid"}
+TRACKING_PREFIXES = ("utm_",)
+
+
+def split_list(text):
+    """Split 'A, B and C' into ['A', 'B', 'C']"""
+    return [part.strip(" ?.") for part in LIST_SPLIT.split(text) if part.strip(" ?.")]
+
+
+def content_words(text):
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in FUNCTION_WORDS]
+
+
+def compared_with(item, others):
+    """Sub-query for one side of a comparison that still says what it is compared with"""
+    return f"{item} (compared with {' and '.join(others)})"
+
+
+def decompose_query(query):
+    """
+    Split a comparative or multi-part question into independent sub-queries.
+
+    Uses cheap pattern matching rather than an LLM call so decomposition adds
+    no latency. Each side of a comparison keeps the others as context
+    ("Python (compared with Rust)"). Returns [query] when there is nothing
+    to split, when the split would need more than MAX_SUB_QUERIES searches
+    (dropping some would leave part of the question unsearched), when a
+    part is only a fragment, or when a sub-query has fewer than
+    MIN_CONTENT_WORDS content words.
+    """
+    text = query.strip().rstrip("?.").strip()
+
+    # Several questions in one ("What is X? How does Y work?")
+    questions = [q.strip() for q in re.split(r"\?\s+", query.strip()) if q.strip(" ?")]
+    if len(questions) > 1:
+        if len(questions) > MAX_SUB_QUERIES or any(len(content_words(q)) < MIN_CONTENT_WORDS for q in questions):
+            return [query]
+        return questions
+
+    items, aspects = [], []
+    match = COMPARE_PATTERN.match(text) or DIFFERENCE_PATTERN.match(text)
+    if match:
+        items = split_list(match.group("items"))
+        aspects = split_list(match.group("aspects") or "")
+    elif VERSUS_PATTERN.search(text):
+        items = [part.strip() for part in VERSUS_PATTERN.split(text) if part.strip()]
+
+    if len(items) < 2 or any(FRAGMENT_PATTERN.search(part) for part in items + aspects):
+        return [query]
+
+    sub_queries = []
+    for item in items:
+        others = [other for other in items if other != item]
+        for aspect in aspects or [""]:
+            sub_queries.append(compared_with(f"{item} {aspect}".strip(), others))
+    if len(sub_queries) > MAX_SUB_QUERIES - 1 or any(
+        len(content_words(sub_query)) < MIN_CONTENT_WORDS for sub_query in sub_queries
+    ):
+        return [query]
+    # Keep the original query too: head-to-head comparison pages are often the best source
+    return [query] + sub_queries
+
+
+def normalize_url(url):
+    """Canonical form of a URL for de-duplication"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode([
+        (key, value) for key, value in parse_qsl(parts.query)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ])
+    path = parts.path.rstrip("/")
+    return f"{host}{path}" + (f"?{query}" if query else "")
+
+
+def content_hash(content):
+    """Hash of whitespace/case-normalized content, to catch mirrored pages"""
+    normalized = " ".join(content.lower().split())
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def merge_results(result_lists, limit=MAX_MERGED_RESULTS):
+    """
+    Merge search results from several sub-queries.
+
+    Duplicates (same normalized URL or same content) are collapsed, keeping
+    the copy with the highest relevance score; results without a URL or
+    without content are not compared on that key. The merged list is
+    ordered by score and capped at `limit`.
+    """
+    candidates = sorted(
+        (result for results in result_lists for result in results),
+        key=lambda r: r.get("score", 0),
+        reverse=True,
+    )
+
+    merged, seen_urls, seen_content = [], set(), set()
+    for result in candidates:
+        url = (result.get("url") or "").strip()
+        content = (result.get("content") or "").strip()
+        url_key = normalize_url(url) if url else None
+        text_key = content_hash(content) if content else None
+        if (url_key and url_key in seen_urls) or (text_key and text_key in seen_content):
+            continue
+        if url_key:
+            seen_urls.add(url_key)
+        if text_key:
+            seen_content.add(text_key)
+        merged.append(result)
+        if len(merged) == limit:
+            break
+    return merged
@@ -0,0 +1,191 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Directory for the structured per-request log; set QUERY_LOG_DIR="" to turn it off
+QUERY_LOG_DIR = os.getenv("QUERY_LOG_DIR", "logs")
+
+# The live file is rotated and gzipped past this size, and at midnight UTC
+QUERY_LOG_MAX_BYTES = int(float(os.getenv("QUERY_LOG_MAX_MB", "64")) * 1024 * 1024)
+
+# Records identify queries by hash only; set this to also store the query
+# text (needed to replay the log with replay.py)
+QUERY_LOG_INCLUDE_TEXT = os.getenv("QUERY_LOG_INCLUDE_TEXT", "0").lower() in ("1", "true", "yes")
+
+# Records waiting for the writer; when full, new records are dropped, never waited on
+QUERY_LOG_QUEUE_SIZE = 10000
+
+# Records written per batch before the file is flushed
+WRITE_BATCH = 500
+
+_STOP = object()
+
+
+def utc_day(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+class QueryLog:
+    """
+    Structured JSONL access log written off the request path.
+
+    log() only puts the record on a bounded queue (dropping it if the queue
+    is full), and a background thread does all serialization and disk I/O.
+    Each worker process writes its own <name>-<pid>.jsonl (queries-<pid>.jsonl
+    for the query log), which is rotated to a timestamped .jsonl.gz when it
+    grows past QUERY_LOG_MAX_BYTES or the UTC day changes.
+    """
+
+    def __init__(self, directory=QUERY_LOG_DIR, max_bytes=QUERY_LOG_MAX_BYTES, queue_size=QUERY_LOG_QUEUE_SIZE,
+                 name="queries"):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.file = None
+        self.file_day = None
+        self.rotations = 0
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def start(self):
+        if not self.enabled or self.thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name=f"{self.name}-log", daemon=True)
+        self.thread.start()
+
+    def log(self, record):
+        """Queue a record for writing; never blocks"""
+        if self.thread is None:
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self, timeout=5.0):
+        """Write out what is queued and stop the writer thread"""
+        if self.thread is None:
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+        self.thread = None
+
+    def snapshot(self):
+        return {
+            "enabled": self.thread is not None,
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+        }
+
+    # --- writer thread ---
+
+    @property
+    def live_path(self):
+        return os.path.join(self.directory, f"{self.name}-{os.getpid()}.jsonl")
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            batch = [record]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in batch)
+            try:
+                self._write([item for item in batch if item is not _STOP])
+            except Exception:
+                logger.exception("Could not write the query log")
+            if stop:
+                break
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write(self, records):
+        for record in records:
+            day = utc_day(record.get("ts", time.time()))
+            if self.file is None:
+                self.file = open(self.live_path, "a", encoding="utf-8")
+                self.file_day = day
+            elif day > self.file_day or self.file.tell() >= self.max_bytes:
+                self._rotate()
+                self.file_day = max(day, self.file_day)
+            self.file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self.written += 1
+        if self.file is not None:
+            self.file.flush()
+
+    def _rotate(self):
+        """Close the live file, gzip it under a timestamped name and start a new one"""
+        self.file.close()
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self.rotations += 1
+        rotated = os.path.join(self.directory, f"{self.name}-{os.getpid()}-{stamp}-{self.rotations}.jsonl")
+        os.replace(self.live_path, rotated)
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        self.file = open(self.live_path, "a", encoding="utf-8")
+
+
+class QueryLogMiddleware:
+    """
+    Logs one record per /ask or /ask/stream request once its response is done.
+
+    Status and total latency are measured here; endpoints add the rest
+    (route, per-node latency, tokens, cache outcome...) as a dict in
+    request.state.query_log. Streamed responses are logged when the
+    stream ends.
+    """
+
+    def __init__(self, app, query_log, paths=("/ask", "/ask/stream")):
+        self.app = app
+        self.query_log = query_log
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths or self.query_log.thread is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = None
+
+        async def send_logged(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_logged)
+        finally:
+            fields = scope.get("state", {}).get("query_log") or {}
+            self.query_log.log({
+                "ts": time.time(),
+                "endpoint": scope["path"],
+                "status": status or 500,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                **fields,
+            })
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Turn the answer cache (and background refreshing) on with ANSWER_CACHE_ENABLED=1.
+# Each worker keeps its own cache and refreshes popular answers with paid runs.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+
+# Also answer KNOWN_QUERIES and the most asked queries at startup, so the first
+# users get cache hits (one paid run per query in every worker, every boot)
+ANSWER_PREFETCH_ON_STARTUP = os.getenv("ANSWER_PREFETCH_ON_STARTUP", "0").lower() in ("1", "true", "yes")
+
+# Answers younger than the soft TTL are served as-is. Between the soft and
+# hard TTL, popular queries are still served while being refreshed in the
+# background; anything older is recomputed inline.
+SOFT_TTL_S = float(os.getenv("ANSWER_SOFT_TTL_S", "900"))
+HARD_TTL_S = float(os.getenv("ANSWER_HARD_TTL_S", "21600"))
+
+# Knowledge-base answers don't go stale like search results do
+DIRECT_TTL_FACTOR = 24
+
+# A query counts as popular once its decayed request count reaches this
+# (about three requests within the last half-life)
+POPULAR_THRESHOLD = 2.5
+POPULARITY_HALF_LIFE_S = 3600
+
+# Background refreshes allowed per hour (each one is a full paid graph run)
+REFRESH_BUDGET_PER_HOUR = int(os.getenv("REFRESH_BUDGET_PER_HOUR", "30"))
+
+# How often to look for popular answers that are about to go stale
+REFRESH_SCAN_INTERVAL_S = 60
+
+MAX_ENTRIES = 1000
+
+# Known hot queries: the example buttons in frontend.py
+KNOWN_QUERIES = [
+    "What are the latest developments in AI?",
+    "What happened in the stock market today?",
+    "What is the capital of France?",
+    "Explain quantum computing in simple terms",
+]
+
+
+def normalize_query(query):
+    """Case/whitespace/punctuation-insensitive form used as the cache key"""
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip(" ?.!")
+
+
+def query_key(query):
+    return hashlib.sha256(normalize_query(query).encode()).hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory answer cache with soft/hard TTLs and query popularity.
+
+    Popularity is a request count that halves every POPULARITY_HALF_LIFE_S,
+    so trending queries rise quickly and fade once interest drops.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.popularity = {}
+
+    def touch(self, key, now=None):
+        """Count a request for a query and return its current popularity"""
+        now = now or time.time()
+        score, last = self.popularity.get(key, (0.0, now))
+        score = score * math.pow(0.5, (now - last) / POPULARITY_HALF_LIFE_S) + 1
+        self.popularity[key] = (score, now)
+        return score
+
+    def is_popular(self, key):
+        score, last = self.popularity.get(key, (0.0, 0.0))
+        return score * math.pow(0.5, (time.time() - last) / POPULARITY_HALF_LIFE_S) >= POPULAR_THRESHOLD
+
+    def soft_ttl(self, entry):
+        return SOFT_TTL_S if entry["result"]["needs_search"] else SOFT_TTL_S * DIRECT_TTL_FACTOR
+
+    def get(self, key):
+        """(entry, age in seconds) or (None, None); entries past the hard TTL are dropped"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None, None
+        age = time.time() - entry["created_at"]
+        hard_ttl = HARD_TTL_S if entry["result"]["needs_search"] else HARD_TTL_S * DIRECT_TTL_FACTOR
+        if age >= hard_ttl:
+            del self.entries[key]
+            return None, None
+        self.entries.move_to_end(key)
+        return entry, age
+
+    def put(self, key, query, result):
+        self.entries[key] = {"query": query, "result": result, "created_at": time.time()}
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            self.popularity.pop(evicted, None)
+        # Keep the popularity table from growing with one-off queries
+        if len(self.popularity) > 10 * self.max_entries:
+            for stale in [k for k, (score, _) in self.popularity.items() if score < 1.5][: self.max_entries]:
+                self.popularity.pop(stale, None)
+
+    def trending(self, limit=10):
+        """Most popular cached queries right now"""
+        now = time.time()
+        scored = [
+            (score * math.pow(0.5, (now - last) / POPULARITY_HALF_LIFE_S), key)
+            for key, (score, last) in self.popularity.items()
+            if key in self.entries
+        ]
+        return [self.entries[key]["query"] for _, key in sorted(scored, reverse=True)[:limit]]
+
+
+class Refresher:
+    """
+    Serves cached answers stale-while-revalidate and refreshes hot queries.
+
+    `runner` is an async function that takes a query and returns the result
+    dict (query, final_answer, steps, needs_search). Refreshes run in the
+    background, one query at a time per key, within REFRESH_BUDGET_PER_HOUR.
+    """
+
+    def __init__(self, runner, cache=None, budget_per_hour=REFRESH_BUDGET_PER_HOUR):
+        self.runner = runner
+        self.cache = cache or AnswerCache()
+        self.budget_per_hour = budget_per_hour
+        self.tokens = float(budget_per_hour)
+        self.tokens_updated = time.monotonic()
+        self.refreshing = set()
+        self.tasks = set()
+        self.scan_task = None
+        self.refreshed = 0
+        self.skipped_for_budget = 0
+
+    # --- serving ---
+
+    def lookup(self, query):
+        """
+        Cached result for a query, or None.
+
+        Returns (result, outcome, age) where outcome is "hit" or "stale".
+        A stale answer is only served for popular queries, and triggers a
+        background refresh.
+        """
+        key = query_key(query)
+        self.cache.touch(key)
+        entry, age = self.cache.get(key)
+        if entry is None:
+            return None
+        if age < self.cache.soft_ttl(entry):
+            return entry["result"], "hit", age
+        if self.cache.is_popular(key):
+            self.schedule(entry["query"])
+            return entry["result"], "stale", age
+        return None
+
+    def store(self, query, result):
+        self.cache.put(query_key(query), query, result)
+
+    # --- refreshing ---
+
+    def _take_budget(self):
+        """Spend one refresh from the hourly token bucket, if any is left"""
+        now = time.monotonic()
+        self.tokens = min(
+            self.budget_per_hour,
+            self.tokens + (now - self.tokens_updated) * self.budget_per_hour / 3600,
+        )
+        self.tokens_updated = now
+        if self.tokens < 1:
+            self.skipped_for_budget += 1
+            return False
+        self.tokens -= 1
+        return True
+
+    def schedule(self, query):
+        """Refresh a query in the background unless already refreshing or out of budget"""
+        key = query_key(query)
+        if key in self.refreshing or not self._take_budget():
+            return
+        self.refreshing.add(key)
+        task = asyncio.create_task(self._refresh(key, query))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _refresh(self, key, query):
+        try:
+            result = await self.runner(query)
+            self.store(query, result)
+            self.refreshed += 1
+        except Exception:
+            logger.exception("Background refresh failed for %r", query)
+        finally:
+            self.refreshing.discard(key)
+
+    async def _scan(self):
+        """Refresh popular answers shortly before they go stale"""
+        while True:
+            await asyncio.sleep(REFRESH_SCAN_INTERVAL_S)
+            for query in self.cache.trending():
+                key = query_key(query)
+                entry, age = self.cache.get(key)
+                if entry and self.cache.is_popular(key) and age >= 0.8 * self.cache.soft_ttl(entry):
+                    self.schedule(query)
+
+    def start(self, warm_queries=()):
+        """Start the background scan and warm the given queries"""
+        self.scan_task = asyncio.create_task(self._scan())
+        for query in warm_queries:
+            if self.cache.get(query_key(query))[0] is None:
+                self.schedule(query)
+
+    async def stop(self):
+        for task in [self.scan_task, *self.tasks]:
+            if task is not None:
+                task.cancel()
+
+    def snapshot(self):
+        return {
+            "cached_answers": len(self.cache.entries),
+            "refreshing": len(self.refreshing),
+            "refreshed": self.refreshed,
+            "skipped_for_budget": self.skipped_for_budget,
+            "refresh_budget_left": int(self.tokens),
+            "trending": self.cache.trending(5),
+        }
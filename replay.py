@@ -0,0 +1,168 @@
+"""
+Replay a recorded query log against backend.app at a fixed rate.
+
+Provider calls are served from a cassette (see cassettes.py), so runs are
+deterministic and need no network access. Queries are sent open-loop at
+--qps, so slow responses do not slow down arrivals, just like real traffic.
+
+    # Record provider calls while serving real traffic
+    CASSETTE_MODE=record uvicorn backend:app
+
+    # Replay a query log offline at 5 QPS with original provider latencies
+    python replay.py --log queries.jsonl --qps 5 --out after.json --compare before.json
+
+The query log is JSON lines with a "query" field per line (extra fields
+are ignored), such as the backend's own logs/queries-*.jsonl(.gz) when it
+runs with QUERY_LOG_INCLUDE_TEXT=1. With --url, requests go to a running
+server instead of an in-process app.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def read_queries(path, limit=None):
+    """Queries from a JSONL (optionally gzipped) log"""
+    opener = gzip.open if path.endswith(".gz") else open
+    queries = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("query"):
+                queries.append(record["query"])
+            if limit and len(queries) >= limit:
+                break
+    return queries
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, wall_s):
+    latencies = sorted(latencies)
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "achieved_qps": round(total / wall_s, 2) if wall_s else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round((latencies[-1] if latencies else 0) * 1000, 1),
+    }
+
+
+async def drive(client, queries, qps):
+    """Send queries at a fixed arrival rate and collect latencies"""
+    latencies, errors = [], 0
+
+    async def send(query):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            response = await client.post("/ask", json={"query": query})
+            if response.status_code != 200:
+                errors += 1
+                return
+        except Exception:
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    tasks = []
+    for i, query in enumerate(queries):
+        delay = start + i / qps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(query)))
+    await asyncio.gather(*tasks)
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def main(args):
+    import httpx
+
+    queries = read_queries(args.log, args.limit)
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            return await drive(client, queries, args.qps)
+
+    # In-process: provider calls come from the cassette, never the network
+    os.environ["CASSETTE_MODE"] = "replay"
+    os.environ["CASSETTE_PATH"] = args.cassette
+    os.environ["CASSETTE_LATENCY_SCALE"] = str(args.latency_scale)
+
+    with tempfile.TemporaryDirectory(prefix="replay-") as workdir:
+        # Measure graph runs rather than cache hits: no answer cache or warm
+        # queries, no query log, no quotas or load shedding, no cluster peers
+        clients_file = os.path.join(workdir, "clients.json")
+        with open(clients_file, "w") as f:
+            f.write("{}")
+        os.environ.update({
+            "ANSWER_CACHE_ENABLED": "0",
+            "QUERY_LOG_DIR": "",
+            "CLIENTS_FILE": clients_file,
+            "USAGE_DB": os.path.join(workdir, "usage.sqlite"),
+            "ADMISSION_TOKEN_CAPACITY": str(10 ** 12),
+            "CLUSTER_PEERS": "",
+        })
+        import backend
+
+        transport = httpx.ASGITransport(app=backend.app)
+        async with backend.app.router.lifespan_context(backend.app):
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://replay", timeout=timeout
+            ) as client:
+                return await drive(client, queries, args.qps)
+
+
+def print_report(result, baseline=None):
+    for name, value in result.items():
+        line = f"{name:>14}: {value}"
+        if baseline and name in baseline and isinstance(value, (int, float)):
+            before = baseline[name]
+            if before:
+                line += f"  (before {before}, {100 * (value - before) / before:+.1f}%)"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--log", required=True, help="JSONL query log (may be .gz)")
+    parser.add_argument("--qps", type=float, default=1.0, help="arrival rate")
+    parser.add_argument("--limit", type=int, help="replay at most this many queries")
+    parser.add_argument("--cassette", default="cassettes/providers.jsonl.gz")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="multiply recorded provider latencies (0 = instant)")
+    parser.add_argument("--url", help="drive a running server instead of backend.app in-process")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--out", help="write the summary as JSON")
+    parser.add_argument("--compare", help="JSON summary of an earlier run to compare against")
+    args = parser.parse_args()
+
+    result = asyncio.run(main(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(1 if result["errors"] else 0)
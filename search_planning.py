@@ -0,0 +1,186 @@
+import logging
+import os
+import re
+import threading
+import time
+
+from query_log import QueryLog
+from refresher import query_key
+
+logger = logging.getLogger(__name__)
+
+# Log one JSON line per search so the policy can be tuned offline. Written
+# like the query log: "search_outcomes.jsonl" becomes search_outcomes-<pid>.jsonl
+# per worker, rotated and gzipped, and query_hash matches the query log's.
+SEARCH_OUTCOME_LOG = os.getenv("SEARCH_OUTCOME_LOG", "")
+
+# Total time we aim to answer a query in (seconds)
+RESEARCH_LATENCY_BUDGET_S = float(os.getenv("RESEARCH_LATENCY_BUDGET_S", "20"))
+
+# Time to keep in reserve for synthesizing the answer after searching
+SYNTHESIS_RESERVE_S = 6.0
+
+# Results per query type
+MAX_RESULTS = {
+    "news": 5,
+    "comparative": 6,
+    "factual": 3,
+}
+
+# Basic results below these are considered "thin" and worth escalating
+MIN_RESULTS = 2
+MIN_MEAN_SCORE = 0.5
+MIN_CONTENT_CHARS = 600
+
+# While a query type is planned as advanced, still try basic on every Nth
+# query, so its quality estimate can recover once basic results improve
+BASIC_EXPLORE_EVERY = 10
+
+NEWS_PATTERN = re.compile(
+    r"\b(latest|today|tonight|yesterday|this (week|month|year)|breaking|news|"
+    r"current(ly)?|recent(ly)?|now|update[sd]?|20\d\d)\b",
+    re.IGNORECASE,
+)
+COMPARATIVE_PATTERN = re.compile(
+    r"\b(compare|comparison|vs\.?|versus|difference(s)? between|better than|"
+    r"pros and cons|which is (better|faster|cheaper))\b",
+    re.IGNORECASE,
+)
+
+
+def classify_query(query):
+    """Classify a query as 'comparative', 'news' or 'factual'"""
+    if COMPARATIVE_PATTERN.search(query):
+        return "comparative"
+    if NEWS_PATTERN.search(query):
+        return "news"
+    return "factual"
+
+
+class SearchPolicy:
+    """
+    Running view of how searches have been going, per query type.
+
+    Keeps a moving average of result quality for basic searches and of
+    latency per depth, which plan_search() uses to decide whether to go
+    straight to an advanced search. Basic quality is only learned from basic
+    searches, so explore_basic() keeps sampling them for types that have
+    been moved to advanced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.basic_quality = {query_type: 0.7 for query_type in MAX_RESULTS}
+        self.latency = {"basic": 1.5, "advanced": 4.0}
+        self.advanced_planned = {query_type: 0 for query_type in MAX_RESULTS}
+
+    def explore_basic(self, query_type):
+        """Called for a query that would go straight to advanced; True on every Nth"""
+        with self._lock:
+            self.advanced_planned[query_type] += 1
+            return self.advanced_planned[query_type] % BASIC_EXPLORE_EVERY == 0
+
+    def record(self, query_type, depth, quality, latency_s):
+        with self._lock:
+            if depth == "basic":
+                self.basic_quality[query_type] = (
+                    0.8 * self.basic_quality[query_type] + 0.2 * quality
+                )
+            self.latency[depth] = 0.8 * self.latency[depth] + 0.2 * latency_s
+
+
+policy = SearchPolicy()
+
+
+def remaining_budget(started_at):
+    """Seconds left of the latency budget for a run that started at `started_at`"""
+    return RESEARCH_LATENCY_BUDGET_S - (time.time() - started_at)
+
+
+def plan_search(query, remaining_s):
+    """
+    Choose search depth and result count for a query.
+
+    Starts with a basic search unless basic results for this kind of query
+    have recently been poor and there is time for an advanced one (every
+    BASIC_EXPLORE_EVERY-th such query still tries basic first). Escalation
+    after a thin basic search is only allowed if an advanced search still fits
+    in the remaining budget.
+    """
+    query_type = classify_query(query)
+    usable_s = remaining_s - SYNTHESIS_RESERVE_S
+    advanced_fits = usable_s >= policy.latency["advanced"]
+
+    depth = "basic"
+    if (
+        advanced_fits
+        and policy.basic_quality[query_type] < MIN_MEAN_SCORE
+        and not policy.explore_basic(query_type)
+    ):
+        depth = "advanced"
+
+    return {
+        "query_type": query_type,
+        "search_depth": depth,
+        "max_results": MAX_RESULTS[query_type],
+        "allow_escalation": (
+            depth == "basic"
+            and usable_s >= policy.latency["basic"] + policy.latency["advanced"]
+        ),
+    }
+
+
+def result_quality(results, max_results):
+    """Score search results between 0 and 1 from relevance scores and coverage"""
+    if not results:
+        return 0.0
+    mean_score = sum(result.get("score", 0) for result in results) / len(results)
+    coverage = min(len(results) / max_results, 1.0)
+    return round(mean_score * coverage, 3)
+
+
+def results_are_thin(results):
+    """True if a basic search came back with too little to synthesize from"""
+    if len(results) < MIN_RESULTS:
+        return True
+    mean_score = sum(result.get("score", 0) for result in results) / len(results)
+    content_chars = sum(len(result.get("content", "")) for result in results)
+    return mean_score < MIN_MEAN_SCORE or content_chars < MIN_CONTENT_CHARS
+
+
+_outcome_log = None
+_outcome_log_lock = threading.Lock()
+
+
+def outcome_log():
+    """Writer for SEARCH_OUTCOME_LOG, started on first use"""
+    global _outcome_log
+    with _outcome_log_lock:
+        if _outcome_log is None:
+            directory, filename = os.path.split(SEARCH_OUTCOME_LOG)
+            _outcome_log = QueryLog(directory or ".", name=filename.removesuffix(".jsonl"))
+            _outcome_log.start()
+    return _outcome_log
+
+
+def log_outcome(query, plan, depth, results, latency_s, escalated):
+    """Update the policy with a finished search and log it for offline tuning"""
+    quality = result_quality(results, plan["max_results"])
+    policy.record(plan["query_type"], depth, quality, latency_s)
+
+    record = {
+        "ts": time.time(),
+        "query_hash": query_key(query)[:16],
+        "query_type": plan["query_type"],
+        "planned_depth": plan["search_depth"],
+        "final_depth": depth,
+        "max_results": plan["max_results"],
+        "escalated": escalated,
+        "num_results": len(results),
+        "quality": quality,
+        "latency_s": round(latency_s, 3),
+    }
+    logger.info("search outcome %s", record)
+    if SEARCH_OUTCOME_LOG:
+        # The search node runs on the event loop, so the file is written elsewhere
+        outcome_log().log(record)
@@ -0,0 +1,133 @@
+"""
+Production entry point for the backend API.
+
+Runs several worker processes (one per available CPU by default). With
+gunicorn installed, the app and its heavy dependencies are imported and
+the graph compiled once in the master process before forking, so workers
+share that memory copy-on-write. Each worker then warms its own provider
+clients and checkpoint store before it accepts traffic. On shutdown a
+worker stops accepting connections, gives open requests up to
+DRAIN_TIMEOUT_S to finish, then gives background graph runs (answer
+refreshes, conversation summaries) the same again before exiting.
+
+    python serve.py                         # all CPUs on :8000
+    python serve.py --workers 4 --port 8080
+"""
+import argparse
+import importlib.util
+import logging
+import os
+
+from dotenv import load_dotenv
+
+# Settings from .env apply to this script and to the app it imports
+load_dotenv()
+
+logger = logging.getLogger("serve")
+
+
+def default_workers():
+    """Number of CPUs this process may run on (respects container CPU pinning)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def preload_app():
+    """Import the app and compile the graph so forked workers inherit them"""
+    import backend
+    from graph_logic import preload_dependencies
+
+    preload_dependencies()
+    backend.compile_graph()
+    return backend.app
+
+
+def uvicorn_worker_class(drain_timeout):
+    # uvicorn's bundled worker moved to the separate uvicorn-worker package
+    if installed("uvicorn_worker"):
+        from uvicorn_worker import UvicornWorker
+    else:
+        from uvicorn.workers import UvicornWorker
+
+    class DrainingWorker(UvicornWorker):
+        # The stock worker waits for open requests without a limit, so gunicorn
+        # would kill it before the app's own shutdown (background drain) ran
+        CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "timeout_graceful_shutdown": int(drain_timeout)}
+
+    return DrainingWorker
+
+
+def run_gunicorn(args, drain_timeout):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return preload_app()
+
+    Server({
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": uvicorn_worker_class(drain_timeout),
+        "preload_app": True,
+        # Open requests, then background runs, each get drain_timeout before the worker is killed
+        "graceful_timeout": 2 * drain_timeout + 5,
+        "timeout": 120,
+        "keepalive": 5,
+        "backlog": 2048,
+    }).run()
+
+
+def run_uvicorn(args, drain_timeout):
+    """Fallback without gunicorn (e.g. Windows): workers import the app themselves"""
+    import uvicorn
+
+    uvicorn.run(
+        "backend:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop" if installed("uvloop") else "asyncio",
+        http="httptools" if installed("httptools") else "h11",
+        # Open requests get this long; the app then drains background runs itself
+        timeout_graceful_shutdown=int(drain_timeout),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY", "0")) or default_workers())
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # Every worker compiles its graph and builds its clients before it reports ready
+    os.environ["WARMUP_ON_STARTUP"] = "1"
+    drain_timeout = float(os.getenv("DRAIN_TIMEOUT_S", "30"))
+
+    logger.info(
+        "Starting %d workers (uvloop: %s, httptools: %s)",
+        args.workers, installed("uvloop"), installed("httptools"),
+    )
+    if args.workers > 1 and os.getenv("CLUSTER_PEERS"):
+        logger.warning("Cluster mode shares caches per worker; run each node with --workers 1")
+    if installed("gunicorn"):
+        run_gunicorn(args, drain_timeout)
+    else:
+        logger.warning("gunicorn not installed; workers will not share preloaded modules")
+        run_uvicorn(args, drain_timeout)
@@ -0,0 +1,105 @@
+"""Page enrichment against the local stand-in server (benchmarks/stand_in_server.py)"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+pytest.importorskip("httpx")
+
+import page_enrichment
+from page_enrichment import BlockedDestination, PageCache, PageFetcher, blocked_address
+from stand_in_server import Handler, serve_pages
+
+
+@pytest.fixture
+def server():
+    with serve_pages() as url:
+        yield url
+
+
+def fetch(cache_dir, url, allow_private=True):
+    async def run():
+        fetcher = PageFetcher(cache=PageCache(str(cache_dir)), allow_private=allow_private)
+        try:
+            return await fetcher.fetch_page_text(url)
+        finally:
+            await fetcher.aclose()
+
+    return asyncio.run(run())
+
+
+def test_extracts_main_text(server, tmp_path):
+    text = fetch(tmp_path, f"{server}/page/1")
+    assert "part of the main article body" in text
+    assert "Copyright" not in text
+    assert "tracking" not in text
+
+
+def test_revalidates_with_conditional_request(server, tmp_path, monkeypatch):
+    first = fetch(tmp_path, f"{server}/page/2")
+    monkeypatch.setattr(page_enrichment, "PAGE_FRESH_S", 0)
+    assert fetch(tmp_path, f"{server}/page/2") == first
+    assert Handler.counts == {"200": 1, "304": 1}
+
+
+def test_follows_redirects(server, tmp_path):
+    assert "(3.0)" in fetch(tmp_path, f"{server}/redirect/3")
+
+
+def test_refuses_loopback_by_default(server, tmp_path):
+    with pytest.raises(BlockedDestination):
+        fetch(tmp_path, f"{server}/page/1", allow_private=False)
+    assert Handler.counts["200"] == 0
+
+
+def test_checks_every_redirect_hop(server, tmp_path):
+    with pytest.raises(BlockedDestination):
+        fetch(tmp_path, f"{server}/redirect-to?url=file:///etc/passwd")
+
+
+def test_skips_non_html(server, tmp_path):
+    assert fetch(tmp_path, f"{server}/data") == ""
+
+
+def test_reads_at_most_max_page_bytes(server, tmp_path, monkeypatch):
+    full = fetch(tmp_path / "full", f"{server}/page/4")
+    monkeypatch.setattr(page_enrichment, "MAX_PAGE_BYTES", 1000)
+    assert len(fetch(tmp_path / "capped", f"{server}/page/4")) < len(full) / 2
+
+
+def test_enrich_sources_keeps_snippet_on_failure(server, tmp_path):
+    async def run():
+        fetcher = PageFetcher(cache=PageCache(str(tmp_path)), allow_private=True)
+        try:
+            return await fetcher.enrich_sources([
+                {"url": f"{server}/page/5", "content": "snippet"},
+                {"url": f"{server}/missing", "content": "snippet"},
+            ])
+        finally:
+            await fetcher.aclose()
+
+    sources, enriched = asyncio.run(run())
+    assert enriched == 1
+    assert "page_text" in sources[0] and "page_text" not in sources[1]
+
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "10.1.2.3", "192.168.0.1", "169.254.169.254", "::1", "::ffff:127.0.0.1"])
+def test_blocked_addresses(address):
+    assert blocked_address(address)
+
+
+def test_public_address_allowed():
+    assert not blocked_address("93.184.216.34")
+
+
+def test_prune_removes_old_entries(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.store("https://example.com/a", "some text")
+    assert cache.prune(max_age_s=3600) == 0
+    assert cache.prune(max_age_s=-1) == 2
+    assert cache.lookup("https://example.com/a") is None